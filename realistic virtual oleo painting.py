@@ -1,7 +1,17 @@
-import bpy
-from math import cos, pi
-from time import time, sleep
+from math import cos, pi, hypot
+from time import time, sleep, monotonic
 import sys, os
+import csv, json
+import hashlib
+import struct
+from urllib.parse import unquote
+import threading
+from types import SimpleNamespace
+import multiprocessing
+import queue
+import socket
+from multiprocessing import shared_memory
+import numpy as np
 import cv2
 import cvzone
 import glob
@@ -14,26 +24,291 @@ bl_info = {
     "blender": (3, 6, 1),
 }
 
+try:
+    import bpy
+    HEADLESS = False
+except ImportError:
+    # Outside Blender (detection worker processes, replay) a stand-in keeps this file
+    # importable. Only the tracking functions are meant to be used there
+    HEADLESS = True
+
+    def _no_op(*args, **kwargs):
+        return None
+
+    # Properties evaluate to their default, so the panel defaults stay readable
+    def _prop_default(*args, **kwargs):
+        return kwargs.get("default")
+
+    bpy = SimpleNamespace(
+        types=SimpleNamespace(PropertyGroup=object, Panel=object, Operator=object, Scene=SimpleNamespace()),
+        props=SimpleNamespace(**{prop: _prop_default for prop in ("BoolProperty", "EnumProperty", "FloatProperty", "IntProperty", "PointerProperty", "StringProperty")}),
+        utils=SimpleNamespace(register_class=_no_op, unregister_class=_no_op),
+        app=SimpleNamespace(handlers=SimpleNamespace(persistent=lambda function: function, depsgraph_update_post=[], load_pre=[])),
+    )
+
 def is_video_device_valid(cap):
     return cap is not None and cap.isOpened()
 
 
+# Camera index to start looking from, or the path of a video file
 def get_video_device(use_cam):
-    for i in range(use_cam, -1, -1):
-        cap = cv2.VideoCapture(i)
+    if isinstance(use_cam, str):
+        cap = cv2.VideoCapture(use_cam)
         if is_video_device_valid(cap):
             return cap
         cap.release()
-    return None
+        return None
+
+    cap, _ = open_video_device(use_cam, CameraProbeCache())
+    return cap
+
+# CAMERA PROBING
+# Opening a missing /dev/video* node or walking through every mode of a camera
+# takes seconds, so which indexes open and the modes each camera offers are kept
+# on disk. The capture API is picked explicitly instead of letting OpenCV try them all
+CAMERA_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "virtual-oleo-painting", "cameras.json")
+if sys.platform.startswith("linux"):
+    CAPTURE_API = cv2.CAP_V4L2
+elif sys.platform == "win32":
+    CAPTURE_API = cv2.CAP_DSHOW
+else:
+    CAPTURE_API = cv2.CAP_ANY
+
+class CameraProbeCache:
+    def __init__(self, path=CAMERA_CACHE_PATH):
+        self.path = path
+        try:
+            with open(path) as cache_file:
+                self.devices = json.load(cache_file)["devices"]
+        except (OSError, ValueError, KeyError):
+            self.devices = {}   # index -> {"opens": bool, "modes": [[width, height, fps, fourcc], ...]}
+        self.changed = False
+
+    def opens(self, index):
+        return self.devices.get(str(index), {}).get("opens")
+
+    def set_opens(self, index, opens):
+        device = self.devices.setdefault(str(index), {})
+        if device.get("opens") != opens:
+            device["opens"] = opens
+            # Something else may be plugged in at that index now
+            device.pop("modes", None)
+            self.changed = True
+
+    def get_modes(self, index):
+        return self.devices.get(str(index), {}).get("modes")
+
+    def set_modes(self, index, modes):
+        self.devices.setdefault(str(index), {})["modes"] = modes
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as cache_file:
+                json.dump({"devices": self.devices}, cache_file)
+            self.changed = False
+        except OSError as error:
+            print(f">> Camera cache not saved: {error}")
+
+    def clear(self):
+        self.devices = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# From use_cam down to 0 like before, skipping indexes known not to open unless
+# nothing else does. Returns the capture and its index, or (None, None)
+def open_video_device(use_cam, cache):
+    indexes = [i for i in range(use_cam, -1, -1) if cache.opens(i) is not False]
+    indexes += [i for i in range(use_cam, -1, -1) if i not in indexes]
+    for i in indexes:
+        cap = cv2.VideoCapture(i, CAPTURE_API)
+        opens = is_video_device_valid(cap)
+        cache.set_opens(i, opens)
+        if opens:
+            cache.save()
+            return cap, i
+        cap.release()
+    cache.save()
+    return None, None
+
+def get_fourcc(cap):
+    return int(cap.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode("ascii", errors="replace")
+
+# Common webcam modes, smallest first
+CAPTURE_MODES = [(640, 480), (800, 600), (960, 540), (1280, 720), (1600, 900), (1920, 1080), (2560, 1440), (3840, 2160)]
+
+# Modes the camera accepts, as it reports them back. The driver snaps every request
+# to the closest mode it supports
+def probe_capture_modes(cap):
+    modes = []
+    for mode_w, mode_h in CAPTURE_MODES:
+        for fourcc in ("MJPG", "YUYV"):
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, mode_w)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, mode_h)
+            cap.set(cv2.CAP_PROP_FPS, 120)
+            mode = [int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                    round(cap.get(cv2.CAP_PROP_FPS)), get_fourcc(cap)]
+            if mode not in modes:
+                modes.append(mode)
+    return modes
+
+# 'MAX' takes the largest mode, 'MATCH' the smallest one that still covers the
+# inference width. Modes below 24 fps are only used when there is nothing else,
+# then the fastest wins and MJPEG beats raw formats (less USB bandwidth, less lag)
+def choose_capture_mode(modes, capture_mode, inference_width):
+    if capture_mode == 'MATCH' and inference_width > 0:
+        covering = [mode for mode in modes if mode[0] >= inference_width]
+        if covering:
+            smallest = min(mode[0] * mode[1] for mode in covering)
+            modes = [mode for mode in covering if mode[0] * mode[1] == smallest]
+    fluent = [mode for mode in modes if mode[2] >= 24] or modes
+    return max(fluent, key=lambda mode: (mode[0] * mode[1], mode[2], mode[3] == "MJPG"))
+
+# Ask the camera for the chosen mode with a single buffered frame, so a read
+# always returns the newest frame. Returns the negotiated resolution
+def set_capture_mode(cap, capture_mode, inference_width, modes):
+    if modes:
+        mode_w, mode_h, fps, fourcc = choose_capture_mode(modes, capture_mode, inference_width)
+        # FOURCC first, V4L2 drivers validate the size against the pixel format
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, mode_w)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, mode_h)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    else:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 10000)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 10000)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+def describe_capture_mode(cap):
+    return (f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} {get_fourcc(cap)} "
+            f"{cap.get(cv2.CAP_PROP_FPS):.0f} fps, {int(cap.get(cv2.CAP_PROP_BUFFERSIZE))} buffered")
+
+# Opens a camera with the best mode for capture_mode, probing its modes only the
+# first time it is seen. Returns None when no camera opens
+def open_camera(use_cam, capture_mode, inference_width):
+    cache = CameraProbeCache()
+    cap, index = open_video_device(use_cam, cache)
+    if cap is None:
+        return None
+
+    modes = cache.get_modes(index)
+    if not modes:
+        modes = probe_capture_modes(cap)
+        cache.set_modes(index, modes)
+        cache.save()
+    set_capture_mode(cap, capture_mode, inference_width, modes)
+    return cap
+
+# Size detection runs at: inference_width wide with the capture aspect ratio.
+# Also returns the factor that maps inference pixels back to capture pixels
+def get_inference_size(capture_width, capture_height, inference_width):
+    if inference_width <= 0 or inference_width >= capture_width:
+        return (capture_width, capture_height), 1
+    scale = capture_width / inference_width
+    return (inference_width, round(capture_height / scale)), scale
+
+# Map a hand found on the downscaled frame back to capture pixels
+def scale_hand(hand, scale):
+    if scale == 1:
+        return hand
+    scaled = dict(hand)
+    scaled["bbox"] = tuple(int(v * scale) for v in hand["bbox"])
+    scaled["lmList"] = [[int(v * scale) for v in lm] for lm in hand["lmList"]]
+    scaled["center"] = tuple(int(v * scale) for v in hand["center"])
+    return scaled
+
+# CAPTURE THREAD
+# Owns the video device and keeps only the newest frames in a small ring buffer,
+# so the tracking loop never waits on cap.read() and never gets a stale frame.
+# Video files are read at frame_rate, like a camera would deliver them
+class FrameGrabber(threading.Thread):
+    def __init__(self, cap, slots=3, frame_rate=0):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.frame_rate = frame_rate
+        self.finished = False   # end of a video file
+        self.slots = [None] * max(3, slots)
+        self.timestamps = [0.0] * len(self.slots)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.latest = -1        # slot with the newest unread frame
+        self.in_use = -1        # slot last handed to the tracking loop
+        self.captured = 0
+        self.consumed = 0
+        self.dropped = 0
+
+    def run(self):
+        write_slot = 0
+        start_time = monotonic()
+        while not self.stop_event.is_set():
+            if self.frame_rate:
+                sleep(max(0, start_time + self.captured / self.frame_rate - monotonic()))
+            # Decode straight into the free slot once it has been allocated
+            if self.slots[write_slot] is None:
+                ok, frame = self.cap.read()
+            else:
+                ok, frame = self.cap.read(self.slots[write_slot])
+            if not ok or frame is None:
+                if self.frame_rate:
+                    self.finished = True
+                    break
+                sleep(0.001)
+                continue
+            timestamp = monotonic()
+
+            with self.lock:
+                self.slots[write_slot] = frame
+                self.timestamps[write_slot] = timestamp
+                if self.latest != -1:
+                    # Previous frame was overwritten before the loop took it
+                    self.dropped += 1
+                self.latest = write_slot
+                self.captured += 1
+                write_slot = next(i for i in range(len(self.slots)) if i != self.latest and i != self.in_use)
+
+    # Returns the newest frame not yet consumed and its capture time (monotonic),
+    # or (None, None). Never blocks
+    def get_latest(self):
+        with self.lock:
+            if self.latest == -1:
+                return None, None
+            self.in_use = self.latest
+            self.latest = -1
+            self.consumed += 1
+            return self.slots[self.in_use], self.timestamps[self.in_use]
+
+    def stats(self):
+        return {"captured": self.captured, "consumed": self.consumed, "dropped": self.dropped}
+
+    def stop(self):
+        self.stop_event.set()
+        self.join(timeout=1)
+        self.cap.release()
  
 # IMPORT AND PLACE PAINTINGS
-def import_paintings(folder, painting_separation):
+# Paintings of the last import
+active_gallery = None
+
+# Import paintings. With streaming only the ones around the current painting are
+# imported, the session loads the rest as the viewer moves along
+def import_paintings(folder, painting_separation, streaming=False, window=2, budget_mb=2048, use_cache=True,
+                     use_lods=False, lod_window=1):
+    global active_gallery
     bpy.ops.object.select_all(action='DESELECT')
     bpy.ops.object.select_by_type(type='EMPTY')
     bpy.ops.object.delete()
     bpy.ops.object.select_by_type(type='MESH')
     bpy.ops.object.delete()
 
+    if active_gallery is not None:
+        active_gallery.close()
+        active_gallery = None
+
     folder_path = folder
     try:
         paintings_paths = [f"{folder_path}/{paint_name}" for paint_name in sorted(os.listdir(folder_path)) if paint_name[-3:] == "glb"]
@@ -43,19 +318,471 @@ def import_paintings(folder, painting_separation):
     if len(paintings_paths) < 1:
         return (True, "Folder does not contain .glb assets")
 
-    for painting_number, path_full_painting in enumerate(paintings_paths):
+    cache = open_import_cache(folder_path) if use_cache else None
+
+    lods = TextureTiers(os.path.join(folder_path, ".lod"), lod_window) if use_lods else None
+
+    # Without streaming the window covers the whole gallery and nothing is evicted
+    if not streaming:
+        window = len(paintings_paths)
+    active_gallery = PaintingGallery(paintings_paths, painting_separation, window, budget_mb, cache, lods)
+    active_gallery.set_current(0)
+    while active_gallery.load_next():
+        pass
+    
+    add_backdrop(len(paintings_paths), painting_separation)
+
+    if cache is not None:
+        cache.save_index()
+        return (False, f"Paintings Placed, {cache.hits} from cache")
+    return (False, "Paintings Placed")
+
+# Import one painting at its place in the gallery, returns the names of its objects
+def import_painting(path, painting_number, painting_separation, cache=None):
+    objects = cache.load(path) if cache is not None else None
+    if objects is None:
         print_disable()
-        bpy.ops.import_scene.gltf(filepath=path_full_painting)
+        bpy.ops.import_scene.gltf(filepath=path)
         print_enable()
-        
-        for obj in bpy.context.selected_objects:
-            obj.select_set(True)
-            
-        bpy.context.object.location[1] = painting_separation * painting_number
-    
+        objects = list(bpy.context.selected_objects)
+        if cache is not None:
+            cache.store(path, objects)
+
+    for obj in objects:
+        # Kept in the .blend, so tools reading the saved scene know what is there
+        obj["painting"] = painting_number
+        if obj.parent is None:
+            obj.location[1] = painting_separation * painting_number
+    return [obj.name for obj in objects]
+
+# IMPORT CACHE
+# Every imported painting is also saved as a .blend named after the hash of its
+# file, so importing it again appends that instead of parsing the glTF. Hashes are
+# remembered by file size and modification time, unchanged files are not read.
+# A folder that cannot be written (read-only, network, full) only costs the
+# speed up, paintings are then imported from glTF as without the cache
+def open_import_cache(paintings_folder):
+    try:
+        return ImportCache(os.path.join(paintings_folder, ".blend_cache"))
+    except OSError as error:
+        print(f">> Cannot create the import cache ({error}), importing glTF files")
+        return None
+
+class ImportCache:
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.index_path = os.path.join(folder, "index.json")
+        try:
+            with open(self.index_path) as index_file:
+                self.index = json.load(index_file)
+        except (OSError, ValueError):
+            self.index = {}
+        self.index_changed = False
+        self.version = "%d.%d" % tuple(bpy.app.version[:2])
+        self.hits = 0
+        self.misses = 0
+        self.writable = True  # cleared by the first failed write
+
+    def get_hash(self, path):
+        stat = os.stat(path)
+        entry = self.index.get(path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        digest = hashlib.sha1()
+        with open(path, "rb") as painting_file:
+            for chunk in iter(lambda: painting_file.read(1 << 20), b""):
+                digest.update(chunk)
+        self.index[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self.index_changed = True
+        return digest.hexdigest()
+
+    # .blend files from one Blender version are not always readable by another
+    def get_cache_path(self, path):
+        return os.path.join(self.folder, f"{self.get_hash(path)}-{self.version}.blend")
+
+    # Appends the cached objects into the scene, or None if there are none
+    def load(self, path):
+        cache_path = self.get_cache_path(path)
+        if not os.path.exists(cache_path):
+            self.misses += 1
+            return None
+
+        try:
+            with bpy.data.libraries.load(cache_path, link=False) as (data_from, data_to):
+                data_to.objects = data_from.objects
+        except OSError as error:
+            print(f">> Cannot read {cache_path} ({error}), importing the glTF file")
+            self.misses += 1
+            return None
+        objects = [obj for obj in data_to.objects if obj is not None]
+        for obj in objects:
+            bpy.context.collection.objects.link(obj)
+            # Written with fake users, appended they must go once the painting is removed
+            obj.use_fake_user = False
+            if obj.type == 'MESH':
+                obj.data.use_fake_user = False
+                for material in obj.data.materials:
+                    if material is not None:
+                        material.use_fake_user = False
+                    for image in get_material_images(material):
+                        image.use_fake_user = False
+        self.hits += 1
+        return objects
+
+    def store(self, path, objects):
+        if not self.writable:
+            return
+        cache_path = self.get_cache_path(path)
+        temporary_path = cache_path[:-len(".blend")] + ".tmp.blend"
+        try:
+            # Images go inside the .blend, the cache must not depend on other files
+            for obj in objects:
+                if obj.type == 'MESH':
+                    for material in obj.data.materials:
+                        for image in get_material_images(material):
+                            if image.packed_file is None:
+                                image.pack()
+
+            bpy.data.libraries.write(temporary_path, set(objects), fake_user=True)
+            os.replace(temporary_path, cache_path)
+        except (OSError, RuntimeError) as error:
+            # Blender reports failed writes as RuntimeError
+            print(f">> Cannot write the import cache ({error}), importing glTF files")
+            self.writable = False
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+
+    def save_index(self):
+        if not self.index_changed:
+            return
+        try:
+            with open(self.index_path, "w") as index_file:
+                json.dump(self.index, index_file)
+        except OSError as error:
+            print(f">> Cannot write {self.index_path} ({error})")
+            return
+        self.index_changed = False
+
+# Images used by a material's texture nodes
+def get_material_images(material):
+    if material is None or material.node_tree is None:
+        return []
+    return [node.image for node in material.node_tree.nodes if node.type == 'TEX_IMAGE' and node.image is not None]
+
+# Rough RAM taken by a painting: its mesh and uncompressed textures, in bytes
+def get_painting_memory(object_names):
+    total = 0
+    images = set()
+    for name in object_names:
+        obj = bpy.data.objects.get(name)
+        if obj is None or obj.type != 'MESH':
+            continue
+        total += len(obj.data.vertices) * 32 + len(obj.data.loops) * 16
+        for material in obj.data.materials:
+            images.update(get_material_images(material))
+    for image in images:
+        width, height = image.size
+        total += width * height * image.channels * (4 if image.is_float else 1)
+    return total
+
+# Delete a painting with its meshes, materials and images (all texture tiers)
+def remove_painting(object_names):
+    data = set()
+    for name in object_names:
+        obj = bpy.data.objects.get(name)
+        if obj is None:
+            continue
+        data.add(obj)
+        if obj.data is not None:
+            data.add(obj.data)
+        if obj.type == 'MESH':
+            for material in obj.data.materials:
+                if material is not None:
+                    data.add(material)
+                    data.update(get_material_images(material))
+                    for node in get_tiered_nodes(material):
+                        full_image = bpy.data.images.get(node["lod_full"])
+                        if full_image is not None:
+                            data.add(full_image)
+    bpy.data.batch_remove(data)
+
+# TEXTURE TIERS
+# Downscaled copies of every texture in a painting's .glb, built once per folder
+# by a process pool ("Build texture tiers" or the 'tiers' command). At runtime the
+# paintings near the current one show their full textures and the rest low tiers
+LOD_SIZES = (1024, 256)      # longest edge of tier 1, 2...
+
+# Embedded and external images of a .glb as (index, name, mime type, encoded bytes).
+# Names are the ones Blender's glTF importer gives the images
+def read_glb_images(path):
+    with open(path, "rb") as glb_file:
+        data = glb_file.read()
+    magic, _, length = struct.unpack_from("<4sII", data, 0)
+    if magic != b"glTF":
+        raise ValueError(f"{path} is not a binary glTF")
+
+    gltf, binary = {}, b""
+    offset = 12
+    while offset < length:
+        chunk_length, chunk_type = struct.unpack_from("<II", data, offset)
+        chunk = data[offset + 8:offset + 8 + chunk_length]
+        if chunk_type == 0x4E4F534A:      # JSON
+            gltf = json.loads(chunk)
+        elif chunk_type == 0x004E4942:    # BIN
+            binary = chunk
+        offset += 8 + chunk_length
+
+    images = []
+    for index, image in enumerate(gltf.get("images", [])):
+        if "bufferView" in image:
+            view = gltf["bufferViews"][image["bufferView"]]
+            start = view.get("byteOffset", 0)
+            encoded = binary[start:start + view["byteLength"]]
+        elif "uri" in image and not image["uri"].startswith("data:"):
+            with open(os.path.join(os.path.dirname(path), unquote(image["uri"])), "rb") as image_file:
+                encoded = image_file.read()
+        else:
+            continue
+        images.append((index, image.get("name") or f"Image_{index}", image.get("mimeType", ""), encoded))
+    return images
+
+# Pool task: writes the tiers of one painting and its manifest.json. Paintings whose
+# manifest matches the file size and modification time are skipped
+def build_painting_tiers(path, lod_folder, sizes=LOD_SIZES):
+    stat = os.stat(path)
+    painting_folder = os.path.join(lod_folder, os.path.splitext(os.path.basename(path))[0])
+    manifest_path = os.path.join(painting_folder, "manifest.json")
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["source"] == [stat.st_size, stat.st_mtime_ns]:
+            return path, 0
+    except (OSError, ValueError, KeyError):
+        pass
+
+    os.makedirs(painting_folder, exist_ok=True)
+    manifest = {"source": [stat.st_size, stat.st_mtime_ns], "images": {}}
+    written = 0
+    for index, name, mime_type, encoded in read_glb_images(path):
+        img = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            continue
+        # Alpha has to survive, everything else is fine as JPEG
+        extension = ".png" if mime_type == "image/png" and img.ndim == 3 and img.shape[2] == 4 else ".jpg"
+        tiers = []
+        for tier, size in enumerate(sizes, 1):
+            scale = min(1, size / max(img.shape[:2]))
+            tier_img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else img
+            tier_path = os.path.join(painting_folder, f"{index}_{tier}{extension}")
+            cv2.imwrite(tier_path, tier_img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            tiers.append(os.path.basename(tier_path))
+            written += 1
+        manifest["images"][name] = tiers
+
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    return path, written
+
+# Builds the tiers of every .glb in folder, returns the number of images written
+def build_texture_tiers(folder, processes=None):
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name[-3:] == "glb"]
+    lod_folder = os.path.join(folder, ".lod")
+    written = 0
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        for path, count in pool.starmap(build_painting_tiers, [(path, lod_folder) for path in paths]):
+            print(f">> {os.path.basename(path)}: {count} tier images")
+            written += count
+    return written
+
+class TextureTiers:
+    def __init__(self, lod_folder, full_window=1):
+        self.lod_folder = lod_folder
+        self.full_window = full_window
+        self.manifests = {}
+
+    # Full textures within full_window of the current painting, then coarser
+    def get_tier(self, distance):
+        if distance <= self.full_window:
+            return 0
+        if distance <= 3 * self.full_window:
+            return min(1, len(LOD_SIZES))
+        return len(LOD_SIZES)
+
+    def get_tier_path(self, path, image_name, tier):
+        painting_folder = os.path.join(self.lod_folder, os.path.splitext(os.path.basename(path))[0])
+        if path not in self.manifests:
+            try:
+                with open(os.path.join(painting_folder, "manifest.json")) as manifest_file:
+                    self.manifests[path] = json.load(manifest_file)["images"]
+            except (OSError, ValueError, KeyError):
+                self.manifests[path] = {}
+        images = self.manifests[path]
+        # Blender adds .001 and so on to names already taken
+        tiers = images.get(image_name) or images.get(image_name.rsplit(".", 1)[0])
+        if not tiers:
+            return None
+        return os.path.join(painting_folder, tiers[min(tier, len(tiers)) - 1])
+
+    # Points the painting's texture nodes at the tier images. Full images that are
+    # not shown get their buffers freed, tier images are loaded on first use
+    def set_tier(self, path, object_names, tier):
+        for material in get_painting_materials(object_names):
+            for node in material.node_tree.nodes:
+                if node.type != 'TEX_IMAGE' or node.image is None:
+                    continue
+                if "lod_full" not in node:
+                    node["lod_full"] = node.image.name
+                full_image = bpy.data.images.get(node["lod_full"])
+                if full_image is None:
+                    continue
+
+                image = full_image
+                tier_path = self.get_tier_path(path, full_image.name, tier) if tier else None
+                if tier_path is not None:
+                    image = bpy.data.images.load(tier_path, check_existing=True)
+                    image.colorspace_settings.name = full_image.colorspace_settings.name
+                    image.alpha_mode = full_image.alpha_mode
+                if node.image != image:
+                    previous = node.image
+                    node.image = image
+                    if previous == full_image:
+                        full_image.buffers_free()
+
+# Materials of a painting's meshes
+def get_painting_materials(object_names):
+    materials = []
+    for name in object_names:
+        obj = bpy.data.objects.get(name)
+        if obj is not None and obj.type == 'MESH':
+            materials += [material for material in obj.data.materials if material is not None and material.node_tree is not None]
+    return materials
+
+# Texture nodes that were switched to tiers at some point
+def get_tiered_nodes(material):
+    if material.node_tree is None:
+        return []
+    return [node for node in material.node_tree.nodes if node.type == 'TEX_IMAGE' and "lod_full" in node]
+
+# STREAMING GALLERY
+# Keeps the paintings within window of the current one imported, wrapping around
+# like the gestures do. Paintings left behind stay until the memory budget runs
+# out, least recently used first. Imports must run on the main thread, so a reader
+# thread only warms the files of the coming paintings into the OS cache
+class PaintingGallery:
+    def __init__(self, paths, painting_separation, window=2, budget_mb=2048, cache=None, lods=None):
+        self.paths = paths
+        self.painting_separation = painting_separation
+        self.cache = cache
+        self.lods = lods
+        self.tiers = {}         # painting -> texture tier shown
+        self.window = window
+        self.budget = budget_mb * 1024 * 1024
+        self.loaded = {}        # painting -> (object names, bytes), least recently used first
+        self.pending = []       # paintings to import, most urgent first
+        self.current = 0
+        self.prefetch_queue = queue.Queue()
+        self.prefetch_thread = threading.Thread(target=self.prefetch_loop, daemon=True)
+        self.prefetch_thread.start()
+
+    def prefetch_loop(self):
+        while True:
+            path = self.prefetch_queue.get()
+            if path is None:
+                return
+            try:
+                with open(path, "rb") as painting_file:
+                    while painting_file.read(1 << 20):
+                        pass
+            except OSError:
+                pass
+
+    # Paintings within distance of current, nearest first
+    def get_window(self, current, distance):
+        total = len(self.paths)
+        paintings = [current % total]
+        for step in range(1, distance + 1):
+            paintings += [(current + step) % total, (current - step) % total]
+        return list(dict.fromkeys(paintings))
+
+    def set_current(self, current):
+        self.current = current % len(self.paths)
+        wanted = self.get_window(self.current, self.window)
+        for painting in reversed(wanted):
+            if painting in self.loaded:
+                self.loaded[painting] = self.loaded.pop(painting)
+        self.pending = [painting for painting in wanted if painting not in self.loaded]
+
+        upcoming = self.pending + [painting for painting in self.get_window(self.current, self.window + 1) if painting not in wanted]
+        for painting in upcoming:
+            self.prefetch_queue.put(self.paths[painting])
+
+        for painting in self.loaded:
+            self.update_tier(painting)
+
+    # Steps around the gallery ring between a painting and the current one
+    def get_distance(self, painting):
+        total = len(self.paths)
+        return min((painting - self.current) % total, (self.current - painting) % total)
+
+    def update_tier(self, painting):
+        if self.lods is None:
+            return
+        tier = self.lods.get_tier(self.get_distance(painting))
+        if self.tiers.get(painting) == tier:
+            return
+        object_names, _ = self.loaded[painting]
+        self.lods.set_tier(self.paths[painting], object_names, tier)
+        self.tiers[painting] = tier
+        self.loaded[painting] = (object_names, get_painting_memory(object_names))
+
+    # Imports one pending painting. Neighbours wait while the camera moves, the
+    # painting it is heading to does not. Returns True if one was imported
+    def load_next(self, neighbours=True):
+        if not self.pending or (not neighbours and self.pending[0] != self.current):
+            return False
+        painting = self.pending.pop(0)
+        object_names = import_painting(self.paths[painting], painting, self.painting_separation, self.cache)
+        self.loaded[painting] = (object_names, 0)
+        self.tiers.pop(painting, None)
+        self.update_tier(painting)
+        if self.lods is None:
+            self.loaded[painting] = (object_names, get_painting_memory(object_names))
+        if self.cache is not None:
+            self.cache.save_index()
+        self.evict()
+        return True
+
+    def evict(self):
+        window = set(self.get_window(self.current, self.window))
+        used = self.memory()
+        for painting in list(self.loaded):
+            if used <= self.budget:
+                break
+            if painting in window:
+                continue
+            object_names, size = self.loaded.pop(painting)
+            self.tiers.pop(painting, None)
+            remove_painting(object_names)
+            used -= size
+
+    def memory(self):
+        return sum(size for _, size in self.loaded.values())
+
+    def summary_line(self):
+        return f"gallery: {len(self.loaded)} of {len(self.paths)} loaded, {self.memory() / 1024 / 1024:.0f} MB"
+
+    def close(self):
+        self.prefetch_queue.put(None)
+
+# Black wall behind the paintings
+def add_backdrop(total_paintings, painting_separation):
     bpy.ops.mesh.primitive_plane_add(
-        size=((len(paintings_paths)+2)*painting_separation),
-        location=(-1, (len(paintings_paths)*painting_separation/2), 0.0),
+        size=((total_paintings+2)*painting_separation),
+        location=(-1, (total_paintings*painting_separation/2), 0.0),
         rotation=(0.0, pi/2, 0.0)
     )
     obj = bpy.context.object
@@ -79,8 +806,6 @@ def import_paintings(folder, painting_separation):
     # Assign the material to the object
     obj.data.materials.append(mat)
 
-    return (False, "Paintings Placed")
-
 # Disable console printing
 def print_disable():
     sys.stdout = open(os.devnull, 'w')
@@ -89,38 +814,107 @@ def print_disable():
 def print_enable():
     sys.stdout = sys.__stdout__
 
+# HDRI LIBRARY
+# Environments registered by name. Images are loaded once per path and size, and
+# switching only points the existing world nodes at another image. Live sizes are
+# downsampled half float EXRs, written once next to the source
+class HdriLibrary:
+    def __init__(self):
+        self.environments = {}  # name -> (path, strength, rotation, width)
+        self.images = {}        # (path, width) -> image
+
+    def register(self, hdri_path, hdri_strength, init_rotation, hdri_width='FULL'):
+        hdri_path = hdri_path.strip('"')
+        name = os.path.splitext(os.path.basename(hdri_path))[0]
+        self.environments[name] = (hdri_path, hdri_strength, init_rotation, hdri_width)
+        return name
+
+    def switch(self, name):
+        return set_hdri(*self.environments[name])
+
+    def get_image(self, hdri_path, hdri_width='FULL'):
+        image = self.images.get((hdri_path, hdri_width))
+        if image is not None:
+            try:
+                image.name
+                return image
+            except ReferenceError:
+                pass
+
+        image = bpy.data.images.load(hdri_path, check_existing=True)
+        if hdri_width != 'FULL':
+            image = get_hdri_variant(image, int(hdri_width))
+        self.images[(hdri_path, hdri_width)] = image
+        return image
+
+hdri_library = HdriLibrary()
+
+# Downsampled copy of an HDRI as a half float EXR in .hdri_variants next to it,
+# rebuilt when the source is newer. EXR is linear, the view transform is not applied
+def get_hdri_variant(image, width):
+    if image.size[0] <= width:
+        return image
+    source_path = bpy.path.abspath(image.filepath)
+    variant_folder = os.path.join(os.path.dirname(source_path), ".hdri_variants")
+    variant_path = os.path.join(variant_folder, f"{os.path.splitext(os.path.basename(source_path))[0]}_{width}.exr")
+
+    if not os.path.exists(variant_path) or os.path.getmtime(variant_path) < os.path.getmtime(source_path):
+        os.makedirs(variant_folder, exist_ok=True)
+        variant = image.copy()
+        variant.scale(width, round(image.size[1] * width / image.size[0]))
+
+        image_settings = bpy.context.scene.render.image_settings
+        previous = (image_settings.file_format, image_settings.color_depth, image_settings.exr_codec)
+        image_settings.file_format = 'OPEN_EXR'
+        image_settings.color_depth = '16'
+        image_settings.exr_codec = 'ZIP'
+        try:
+            variant.save_render(variant_path, scene=bpy.context.scene)
+        finally:
+            image_settings.file_format, image_settings.color_depth, image_settings.exr_codec = previous
+            bpy.data.images.remove(variant)
+
+    variant = bpy.data.images.load(variant_path, check_existing=True)
+    variant.use_half_precision = True
+    return variant
+
 # Set HDRI environment
-def set_hdri(hdri_path, hdri_strength, init_rotation):
+def set_hdri(hdri_path, hdri_strength, init_rotation, hdri_width='FULL'):
     bpy.data.worlds['World'].use_nodes = True
     # Load HDRI
     hdri_path = hdri_path.strip('"')
     try:
-        hdri = bpy.data.images.load(hdri_path)
+        hdri = hdri_library.get_image(hdri_path, hdri_width)
     except:
         return "File does not exist"
 
-    # Setup node environment
+    # Setup node environment, built once and reused when switching environments
     world_node_tree = bpy.context.scene.world.node_tree
-    world_node_tree.nodes.clear()
-
-    # Add nodes
-    coordinate_node = world_node_tree.nodes.new(type="ShaderNodeTexCoord")
-    node_mapping = world_node_tree.nodes.new(type="ShaderNodeMapping")
-    node_environment = world_node_tree.nodes.new(type="ShaderNodeTexEnvironment")
-    world_background_node = world_node_tree.nodes.new(type="ShaderNodeBackground")
-    world_output_node = world_node_tree.nodes.new(type="ShaderNodeOutputWorld")
-
-    coordinate_node.location.x = 0
-    node_mapping.location.x = 300
-    node_environment.location.x = 600
-    world_background_node.location.x = 900
-    world_output_node.location.x = 1200
-
-    # Link 
-    world_node_tree.links.new(coordinate_node.outputs["Generated"], node_mapping.inputs["Vector"])
-    world_node_tree.links.new(node_mapping.outputs["Vector"], node_environment.inputs["Vector"])
-    world_node_tree.links.new(node_environment.outputs["Color"], world_background_node.inputs["Color"])
-    world_node_tree.links.new(world_background_node.outputs["Background"], world_output_node.inputs["Surface"])
+    node_mapping = world_node_tree.nodes.get("Mapping")
+    node_environment = world_node_tree.nodes.get("Environment Texture")
+    world_background_node = world_node_tree.nodes.get("Background")
+
+    if node_mapping is None or node_environment is None or world_background_node is None:
+        world_node_tree.nodes.clear()
+
+        # Add nodes
+        coordinate_node = world_node_tree.nodes.new(type="ShaderNodeTexCoord")
+        node_mapping = world_node_tree.nodes.new(type="ShaderNodeMapping")
+        node_environment = world_node_tree.nodes.new(type="ShaderNodeTexEnvironment")
+        world_background_node = world_node_tree.nodes.new(type="ShaderNodeBackground")
+        world_output_node = world_node_tree.nodes.new(type="ShaderNodeOutputWorld")
+
+        coordinate_node.location.x = 0
+        node_mapping.location.x = 300
+        node_environment.location.x = 600
+        world_background_node.location.x = 900
+        world_output_node.location.x = 1200
+
+        # Link 
+        world_node_tree.links.new(coordinate_node.outputs["Generated"], node_mapping.inputs["Vector"])
+        world_node_tree.links.new(node_mapping.outputs["Vector"], node_environment.inputs["Vector"])
+        world_node_tree.links.new(node_environment.outputs["Color"], world_background_node.inputs["Color"])
+        world_node_tree.links.new(world_background_node.outputs["Background"], world_output_node.inputs["Surface"])
 
     # Add image to environment
     node_environment.image = hdri
@@ -201,7 +995,7 @@ def set_viewport_render():
     bpy.context.scene.render.engine = 'BLENDER_EEVEE'
 
 # Set camera to view and remove lines
-def set_viewport_start(space, context, res_x, rex_y, zoom):
+def set_viewport_start(space, context, res_x, rex_y, zoom, taa_samples=45):
     space.region_3d.view_perspective = 'CAMERA'
     space.region_3d.view_camera_offset = (0.0,0.0) 
     space.region_3d.view_camera_zoom = zoom
@@ -210,7 +1004,7 @@ def set_viewport_start(space, context, res_x, rex_y, zoom):
 
     space.shading.type = 'RENDERED'
     bpy.context.scene.render.engine = 'BLENDER_EEVEE'
-    bpy.context.scene.eevee.taa_samples = 45
+    bpy.context.scene.eevee.taa_samples = taa_samples
 
     for scene in bpy.data.scenes:
         scene.render.resolution_x = res_x
@@ -260,107 +1054,529 @@ def refresh_and_get_delay(frame_rate = 1, starting_ms = time()):
     return delay
     
 
-def move_camera(camera, current_image, desired_image, duration_frames, frame_rate, painting_separation):
-    currentCameraPos = initialCameraPos = camera.location[1]
-    desiredCameraPos = painting_separation*desired_image
-    finalCameraPos = (desiredCameraPos-initialCameraPos)/2
+# Cosine ease-in-out between 0 and 1, computed once per transition length
+def get_easing_curve(duration_frames):
+    return [(1 - cos(pi * i / duration_frames)) / 2 for i in range(1, duration_frames + 1)]
+
+# Camera transitions advanced one tick at a time from the session's timer, so face
+# tracking keeps updating the HDRI and bulb while the camera travels. A gesture that
+# arrives mid-transition retargets it from wherever the camera is
+class CameraAnimator:
+    def __init__(self, position, painting_separation, duration_frames=20):
+        self.painting_separation = painting_separation
+        self.curve = get_easing_curve(duration_frames)
+        self.current = self.start = self.target = position
+        self.step = len(self.curve)
+
+    def move_to(self, desired_image):
+        self.start = self.current
+        self.target = self.painting_separation * desired_image
+        self.step = 0
+
+    def is_moving(self):
+        return self.step < len(self.curve)
+
+    # Gallery position the camera is at, the bulb follows it
+    def position(self):
+        return self.current
+
+    # Returns True while a transition is in flight
+    def tick(self):
+        if not self.is_moving():
+            return False
+        self.current = self.start + (self.target - self.start) * self.curve[self.step]
+        self.step += 1
+        return True
 
-    for i in range(duration_frames):
-        currentCameraPos = -finalCameraPos * cos((pi)*i/duration_frames) + finalCameraPos + initialCameraPos
-        camera.location[1] = currentCameraPos
+'''
+DETECTION BACKENDS
+Both backends take crops as (up, down, left, right) in inference pixels. They give
+faces as a list of [x, y] landmarks relative to the face crop, and hands as cvzone hand dicts in inference pixels
+'''
 
-        if i == duration_frames-1:
-            camera.location[1] = desiredCameraPos
-        
-        try:
-            bulb_empty = bpy.data.objects['bulb_empty']
-            bulb_empty.location[1] = finalCameraPos
-        except:
-            pass
+DETECTION_KINDS = ('face', 'hand')
+
+# (up, down, left, right) clamped to the frame, so slicing never wraps around or
+# runs past an edge. It can come out empty, see is_crop_empty()
+def clamp_crop(rect, shape):
+    height, width = shape[:2]
+    up, down, left, right = (max(0, int(v)) for v in rect)
+    return min(up, height), min(down, height), min(left, width), min(right, width)
+
+def is_crop_empty(rect):
+    up, down, left, right = rect
+    return down <= up or right <= left
+
+# Hand area in inference pixels. A face low in the frame puts it past the bottom edge
+def get_hand_crop(hand_detect_rect, scale, shape):
+    return clamp_crop([v / scale for v in hand_detect_rect], shape)
+
+def find_hand_in_crop(hand_detector, img, rect):
+    up, down, left, right = rect
+    hands, _ = hand_detector.findHands(img[up:down, left:right], draw=False, flipType= False)
+    if not hands:
+        return None
+
+    hand = hands[0]
+    x, y, width, height = hand["bbox"]
+    return {
+        "lmList": [[lm[0] + left, lm[1] + up, lm[2]] for lm in hand["lmList"]],
+        "bbox": (x + left, y + up, width, height),
+        "center": (hand["center"][0] + left, hand["center"][1] + up),
+        "type": hand["type"],
+    }
+
+# MediaPipe on the calling thread, one detection after the other
+class InProcessDetection:
+    def __init__(self):
+        self.face_detector = FaceMeshDetector(maxFaces=1, minDetectionCon=0.3)
+        self.hand_detector = HandDetector(detectionCon=0.4, maxHands=1, minTrackCon=0.5)
+
+    # Array the next detection frame can be written into, None to let OpenCV allocate
+    def begin_frame(self, shape):
+        return None
+
+    def prefetch_hand(self, img, rect):
+        pass
 
-        delay = refresh_and_get_delay(frame_rate)
-        sleep(delay)        
-    
-    return desired_image
-
-# returns current image, a hand buffer and int value for gesture_detection
-def handle_hands(img, faceDetector, hand_detector, current_image, camera, face, frame_rate, painting_separation, gesture_detection, hand_buffer, total_paintings):
-    hands, _ = hand_detector.findHands(img, draw=False, flipType= False)
-    if hands:
-        hand = hands[0]
-        x, y, width, height = hand["bbox"]
-        lmList = hand["lmList"]
-        center = hand["center"]
-        hand_type = hand['type']
+    def find_face(self, img, crop):
+        up, down, left, right = crop
+        _, faces = self.face_detector.findFaceMesh(img=img[up:down, left:right], draw=False)
+        return faces[0] if faces else None
 
-        if True:
-            #cv2.rectangle(img, (leftCorner1), (leftCorner2), (255,0,0), 2)
-            #cv2.rectangle(img, (rightCorner1), (rightCorner2), (255,0,0), 2)
-            
-            fingers = hand_detector.fingersUp(hand)
-            desired_image = current_image
-            
-            # if detection mode is active, landmark list is compared to the one in the buffer
-            if gesture_detection == 2:
-                if  (hand_type == 'Left'):
-                    desired_image -= 1
-                    gesture_detection = 1 
-                    
-                elif (hand_type == 'Right'):
-                    desired_image += 1
-                    gesture_detection = 0
-
-            vertical_finger = (lmList[5][0] > lmList[2][0] and lmList[11][0] < lmList[17][0]) or (lmList[5][0] < lmList[2][0] and lmList[11][0] > lmList[17][0])
-
-            if (fingers[1:5] == [1,0,0,0]):
-                if vertical_finger and gesture_detection !=0:
-                    gesture_detection = 2
-            else:
-                gesture_detection = 1  
+    def find_hand(self, img, rect):
+        return find_hand_in_crop(self.hand_detector, img, rect)
 
-            desired_image = desired_image % total_paintings
-    
-            if desired_image != current_image:
-                return move_camera(camera, current_image, desired_image, 20, frame_rate, painting_separation), hand, 0
-        else:
-            gesture_detection = 1
+    def close(self):
+        pass
+
+# Entry point of a detection worker process, see WorkerDetection
+def detection_worker(kind, jobs, results):
+    if kind == 'face':
+        detector = FaceMeshDetector(maxFaces=1, minDetectionCon=0.3)
+    else:
+        detector = HandDetector(detectionCon=0.4, maxHands=1, minTrackCon=0.5)
+    results.put((-1, None))
 
-        return current_image, hand, gesture_detection
+    buffers, frames = [], []
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
 
-    return current_image, {}, 1
+        if job[0] == 'attach':
+            _, names, shape = job
+            frames = []
+            for buffer in buffers:
+                buffer.close()
+            buffers = [shared_memory.SharedMemory(name=name) for name in names]
+            frames = [np.ndarray(shape, dtype=np.uint8, buffer=buffer.buf) for buffer in buffers]
+            continue
+
+        _, frame_id, slot, bounds = job
+        if kind == 'face':
+            up, down, left, right = bounds
+            _, faces = detector.findFaceMesh(img=frames[slot][up:down, left:right], draw=False)
+            result = np.array(faces[0], dtype=np.int32) if faces else None
+        else:
+            result = find_hand_in_crop(detector, frames[slot], bounds)
+            if result:
+                result["lmList"] = np.array(result["lmList"], dtype=np.int32)
+        results.put((frame_id, result))
+
+    frames = []
+    for buffer in buffers:
+        buffer.close()
+
+# Face mesh and hand detection in their own processes, so both run in parallel and
+# off Blender's main thread. Frames are written once into shared memory slots, only
+# landmark arrays come back. Hand detection for a frame can start from the previous
+# face box before the face is found. If a worker dies, detection falls back to
+# InProcessDetection for the rest of the session
+class WorkerDetection:
+    def __init__(self, slots=2, timeout=30):
+        context = multiprocessing.get_context("spawn")
+        self.jobs = {kind: context.Queue() for kind in DETECTION_KINDS}
+        self.results = {kind: context.Queue() for kind in DETECTION_KINDS}
+        self.workers = {kind: context.Process(target=detection_worker, args=(kind, self.jobs[kind], self.results[kind]), daemon=True) for kind in DETECTION_KINDS}
+        self.slots = slots
+        self.buffers = []
+        self.frames = []
+        self.shape = None
+        self.frame_id = 0
+        self.hand_prefetched = False
+        self.hand_pending = []      # frames of hand jobs whose results have not come back
+        self.fallback = None
 
+        try:
+            for worker in self.workers.values():
+                worker.start()
+            # Wait until MediaPipe is loaded in every worker
+            for kind in DETECTION_KINDS:
+                self._wait(kind, -1, timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def _wait(self, kind, frame_id, timeout=5):
+        deadline = time() + timeout
+        while time() < deadline:
+            if not self.workers[kind].is_alive():
+                raise RuntimeError(f"{kind} worker stopped")
+            try:
+                result_id, result = self.results[kind].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            # The worker answers in order, everything up to this frame is done
+            if kind == 'hand':
+                self.hand_pending = [pending for pending in self.hand_pending if pending > result_id]
+            # Results of prefetches nobody asked for are dropped here
+            if result_id == frame_id:
+                return result
+        raise RuntimeError(f"{kind} worker timed out")
+
+    def _attach(self, shape):
+        self._release_buffers()
+        size = shape[0] * shape[1] * shape[2]
+        self.buffers = [shared_memory.SharedMemory(create=True, size=size) for _ in range(self.slots)]
+        self.frames = [np.ndarray(shape, dtype=np.uint8, buffer=buffer.buf) for buffer in self.buffers]
+        self.shape = shape
+        for kind in DETECTION_KINDS:
+            self.jobs[kind].put(('attach', [buffer.name for buffer in self.buffers], shape))
+
+    def _release_buffers(self):
+        self.frames = []
+        for buffer in self.buffers:
+            try:
+                buffer.close()
+            except BufferError:
+                # A frame of this buffer is still referenced, the mapping goes with it
+                pass
+            buffer.unlink()
+        self.buffers = []
+
+    def _post(self, kind, img, bounds):
+        frame = self.frames[self.frame_id % self.slots]
+        if not np.may_share_memory(img, frame):
+            np.copyto(frame, img)
+        self.jobs[kind].put(('detect', self.frame_id, self.frame_id % self.slots, bounds))
+        if kind == 'hand':
+            self.hand_pending.append(self.frame_id)
+
+    def _fall_back(self, error):
+        print(f">> Detection workers failed ({error}), continuing in-process")
+        self.fallback = InProcessDetection()
+        self._stop_workers()
+
+    def begin_frame(self, shape):
+        if self.fallback:
+            return None
+        if shape != self.shape:
+            self._attach(shape)
+        self.frame_id += 1
+        self.hand_prefetched = False
+
+        # A prefetch nobody waited for may still be reading the slot about to be written
+        reading = [pending for pending in self.hand_pending if pending % self.slots == self.frame_id % self.slots]
+        if reading:
+            try:
+                self._wait('hand', reading[-1])
+            except RuntimeError as error:
+                self._fall_back(error)
+                return None
+        return self.frames[self.frame_id % self.slots]
+
+    def prefetch_hand(self, img, rect):
+        if self.fallback:
+            return
+        self._post('hand', img, rect)
+        self.hand_prefetched = True
+
+    def find_face(self, img, crop):
+        if not self.fallback:
+            try:
+                self._post('face', img, crop)
+                face = self._wait('face', self.frame_id)
+                return face.tolist() if face is not None else None
+            except RuntimeError as error:
+                self._fall_back(error)
+        return self.fallback.find_face(img, crop)
+
+    def find_hand(self, img, rect):
+        if not self.fallback:
+            try:
+                if not self.hand_prefetched:
+                    self._post('hand', img, rect)
+                hand = self._wait('hand', self.frame_id)
+                if hand:
+                    hand["lmList"] = hand["lmList"].tolist()
+                return hand
+            except RuntimeError as error:
+                self._fall_back(error)
+        return self.fallback.find_hand(img, rect)
+
+    def _stop_workers(self):
+        for kind, worker in self.workers.items():
+            if worker.is_alive():
+                self.jobs[kind].put(None)
+        for worker in self.workers.values():
+            if worker.pid is not None:
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.terminate()
+
+    def close(self):
+        if not self.fallback:
+            self._stop_workers()
+        self._release_buffers()
+
+def get_detection_backend(detection_backend):
+    if detection_backend == 'WORKERS':
+        try:
+            return WorkerDetection()
+        except Exception as error:
+            print(f">> Detection workers unavailable ({error}), running in-process")
+    return InProcessDetection()
 
-def handle_faces(img, faceDetector, targetDetector, cap, transitionFrames, cur_transition):           
-    width  = cap.get(3)
-    height  = cap.get(4)
+'''
+GESTURES
+Recent hand landmarks are kept in fixed size arrays and classified together:
+pointing (index finger up, palm facing the camera), pinch (thumb and index tips
+touching) and horizontal swipes of the palm. Distances are in hand sizes (wrist to
+middle knuckle), so the same thresholds work at any resolution or distance
+'''
+GESTURES = ("none", "point", "pinch", "swipe_left", "swipe_right")
+GESTURE_PARAMS = {
+    "window": 16,           # frames a swipe can span
+    "swipe_time": 0.4,      # s
+    "swipe_distance": 1.0,  # hand sizes the palm has to travel
+    "pinch_distance": 0.25, # hand sizes between thumb and index tips
+}
+PALM_LANDMARKS = [0, 5, 9, 13, 17]
+
+# Per frame of (frames, 21, 3) landmarks: the index finger alone is up, and the
+# hand is held side on so the finger stands vertical. Tips count as up above their
+# middle joint, like HandDetector.fingersUp()
+def get_pointing_pose(landmarks):
+    x, y = landmarks[..., 0], landmarks[..., 1]
+    fingers_up = y[:, [8, 12, 16, 20]] < y[:, [6, 10, 14, 18]]
+    index_only = fingers_up[:, 0] & ~fingers_up[:, 1:].any(axis=1)
+    vertical_finger = ((x[:, 5] > x[:, 2]) & (x[:, 11] < x[:, 17])) | ((x[:, 5] < x[:, 2]) & (x[:, 11] > x[:, 17]))
+    return index_only, vertical_finger
+
+# Gesture of every frame of a sequence, as indexes into GESTURES. landmarks is
+# (frames, 21, 3), times in seconds and valid marks frames where a hand was found.
+# Works the same on the live window and on whole recordings
+def classify_gestures(landmarks, times, valid, params=GESTURE_PARAMS):
+    x, y = landmarks[..., 0], landmarks[..., 1]
+    frames = len(valid)
+
+    index_only, vertical_finger = get_pointing_pose(landmarks)
+    point = valid & index_only & vertical_finger
+
+    hand_size = np.hypot(x[:, 9] - x[:, 0], y[:, 9] - y[:, 0]) + 1e-6
+    pinch = valid & (np.hypot(x[:, 4] - x[:, 8], y[:, 4] - y[:, 8]) / hand_size < params["pinch_distance"])
+
+    # Palm travel against each of the previous frames of an unbroken run
+    index = np.arange(frames)
+    run = index - np.maximum.accumulate(np.where(valid, -1, index))
+    lags = np.arange(1, params["window"])
+    previous = np.clip(index[:, None] - lags, 0, None)
+    in_run = (lags < run[:, None]) & (times[:, None] - times[previous] <= params["swipe_time"])
+    centre = landmarks[:, PALM_LANDMARKS, :2].mean(axis=1)
+    dx = centre[:, None, 0] - centre[previous, 0]
+    dy = centre[:, None, 1] - centre[previous, 1]
+    swipe = in_run & (np.abs(dx) > params["swipe_distance"] * hand_size[:, None]) & (np.abs(dx) > 2 * np.abs(dy))
+    swiping = swipe.any(axis=1)
+    swipe_dx = dx[index, swipe.argmax(axis=1)]
+
+    gestures = np.zeros(frames, dtype=np.int8)
+    gestures[point] = GESTURES.index("point")
+    gestures[pinch] = GESTURES.index("pinch")
+    gestures[swiping & (swipe_dx < 0)] = GESTURES.index("swipe_left")
+    gestures[swiping & (swipe_dx > 0)] = GESTURES.index("swipe_right")
+    return gestures
+
+# Frames where a gesture starts, per gesture name. For tuning thresholds offline
+def count_gestures(gestures):
+    starts = gestures[np.r_[True, gestures[1:] != gestures[:-1]]]
+    return {name: int(np.count_nonzero(starts == code)) for code, name in enumerate(GESTURES) if code}
+
+class GestureEngine:
+    def __init__(self, params=GESTURE_PARAMS, record=False):
+        self.params = params
+        window = params["window"]
+        self.landmarks = np.zeros((window, 21, 3), dtype=np.float32)
+        self.times = np.zeros(window)
+        self.hand_types = np.zeros(window, dtype=np.int8)   # 1 right, -1 left
+        self.valid = np.zeros(window, dtype=bool)
+        self.position = 0
+        self.last = "none"
+        self.recording = [] if record else None
+
+    # hand from find_hand(), or None/{} when no hand was found
+    def push(self, hand, frame_time):
+        slot = self.position % len(self.valid)
+        self.valid[slot] = bool(hand)
+        if hand:
+            self.landmarks[slot] = hand["lmList"]
+            self.hand_types[slot] = 1 if hand["type"] == "Right" else -1
+        self.times[slot] = frame_time
+        self.position += 1
+        if self.recording is not None:
+            self.recording.append((self.landmarks[slot].copy(), frame_time, self.hand_types[slot] if hand else 0, bool(hand)))
+
+    # Gesture of the newest frame
+    def classify(self):
+        order = np.arange(self.position - len(self.valid), self.position) % len(self.valid)
+        self.last = GESTURES[classify_gestures(self.landmarks[order], self.times[order], self.valid[order], self.params)[-1]]
+        return self.last
+
+    # Forget the history once a gesture was acted on, so it does not fire twice
+    def reset(self):
+        self.valid[:] = False
+
+    def save_recording(self, path):
+        landmarks, times, hand_types, valid = zip(*self.recording) if self.recording else ((), (), (), ())
+        np.savez(path, landmarks=np.array(landmarks, dtype=np.float32).reshape(-1, 21, 3),
+                 times=np.array(times), hand_types=np.array(hand_types, dtype=np.int8), valid=np.array(valid, dtype=bool))
+
+
+# returns the gallery step (-1, 0 or 1), a hand buffer and int value for gesture_detection
+def handle_hands(img, hand_rect, detection, gesture_detection, gestures, frame_time):
+    hand = detection.find_hand(img, hand_rect)
+    gestures.push(hand, frame_time)
+    if hand:
+        hand_type = hand['type']
+        gesture = gestures.classify()
+        step = 0
+
+        # A swipe moves along the gallery in its direction
+        if gesture == "swipe_right":
+            step = 1
+        elif gesture == "swipe_left":
+            step = -1
+
+        # if detection mode is active, the hand shown after pointing picks the direction
+        elif gesture_detection == 2:
+            if  (hand_type == 'Left'):
+                step = -1
+                gesture_detection = 1 
+                
+            elif (hand_type == 'Right'):
+                step = 1
+                gesture_detection = 0
+
+        # Only a hand out of the index-only pose re-arms pointing, a tilted finger
+        # keeps the state it had
+        if gesture == "point":
+            if gesture_detection !=0:
+                gesture_detection = 2
+        elif not get_pointing_pose(np.array([hand["lmList"]]))[0][0]:
+            gesture_detection = 1  
+
+        if step:
+            gestures.reset()
+            return step, hand, 0
+
+        return 0, hand, gesture_detection
+
+    return 0, {}, 1
+
+
+# Face bounds (up, down, left, right) from the forehead, chin and cheek landmarks
+def get_face_bounds(face):
+    xs = (face[234][0], face[454][0])
+    ys = (face[10][1], face[152][1])
+    return min(ys), max(ys), min(xs), max(xs)
+
+# After a full-frame acquisition, face mesh runs on a padded crop around the last
+# face bounds. When the face is lost there (low confidence) or touches an edge of the
+# crop that isn't an edge of the frame, the frame is searched in full again
+class FaceRoiTracker:
+    def __init__(self, padding=0.6, edge_margin=2):
+        self.padding = padding
+        self.edge_margin = edge_margin
+        self.roi = None         # last face bounds, inference pixels
+        self.hits = 0
+        self.misses = 0
+        self.full_detections = 0
+
+    # Crop for this frame inside the search area, and whether it is a tracking crop
+    def get_crop(self, search):
+        if self.roi is None:
+            return search, False
+        up, down, left, right = self.roi
+        pad_y = int((down - up) * self.padding)
+        pad_x = int((right - left) * self.padding)
+        crop = (max(search[0], up - pad_y), min(search[1], down + pad_y),
+                max(search[2], left - pad_x), min(search[3], right + pad_x))
+        if crop[1] <= crop[0] or crop[3] <= crop[2]:
+            return search, False
+        return crop, True
+
+    # bounds are in the crop's coordinates, None when no face was found
+    def is_inside(self, bounds, crop, search):
+        if bounds is None:
+            return False
+        height, width = crop[1] - crop[0], crop[3] - crop[2]
+        m = self.edge_margin
+        return ((bounds[0] > m or crop[0] == search[0]) and (bounds[1] < height - m or crop[1] == search[1]) and
+                (bounds[2] > m or crop[2] == search[2]) and (bounds[3] < width - m or crop[3] == search[3]))
+
+    def track(self, bounds, crop):
+        self.hits += 1
+        self.roi = (bounds[0] + crop[0], bounds[1] + crop[0], bounds[2] + crop[2], bounds[3] + crop[2])
+
+    def acquire(self, bounds, crop):
+        self.full_detections += 1
+        self.roi = None if bounds is None else (bounds[0] + crop[0], bounds[1] + crop[0], bounds[2] + crop[2], bounds[3] + crop[2])
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "full": self.full_detections}
+
+# img is the inference frame, scale maps it back to capture pixels. Every
+# returned coordinate is in capture pixels
+def handle_faces(img, detection, transitionFrames, cur_transition, centre_face, scale=1, roi_tracker=None):           
+    inf_height, inf_width = img.shape[:2]
+    width, height = inf_width * scale, inf_height * scale
     face = False
 
-    static_crop_img = img.copy()
-    _, w, _ = static_crop_img.shape
-    min_w = w // 3
-    max_w = w - min_w   
-    static_crop_img[:, :min_w] = (0,0,0)
-    static_crop_img[:, max_w:] = (0,0,0)
-
-    _, faces = faceDetector.findFaceMesh(img=static_crop_img, draw=False)
-    #cv2.imshow('Target Detector', img_win_1)
-
-    if faces and cur_transition > 0:
-        dynamic_crop_img = img.copy()
-        _, w, _ = dynamic_crop_img.shape
-        min_w = int(w/3 * cur_transition / transitionFrames)
-        max_w = w - min_w
-        dynamic_crop_img[:,:min_w] = (0,0,0)
-        dynamic_crop_img[:,max_w:] = (0,0,0)
-        img = dynamic_crop_img
+    # When a face has just entered the centre third, crop to it and widen back to the
+    # full frame over transitionFrames. The crop is a view of img, nothing is copied
+    min_w = 0
+    if centre_face and cur_transition > 0:
+        min_w = int(inf_width/3 * cur_transition / transitionFrames)
         cur_transition -= 1
+    max_w = inf_width - min_w
 
-    elif not faces:
-        cur_transition = transitionFrames
+    search = (0, inf_height, min_w, max_w)
+
+    # Single face mesh inference, landmarks come back relative to the view
+    if roi_tracker is None:
+        crop = search
+        face_landmarks = detection.find_face(img, crop)
+    else:
+        crop, tracking = roi_tracker.get_crop(search)
+        face_landmarks = detection.find_face(img, crop)
+        bounds = get_face_bounds(face_landmarks) if face_landmarks else None
 
-    img, faces = targetDetector.findFaceMesh(img=img, draw=True)
-    if faces:
-        face = faces[0]
+        if tracking and roi_tracker.is_inside(bounds, crop, search):
+            roi_tracker.track(bounds, crop)
+        else:
+            if tracking:
+                # Lost in the crop, look for it in the whole search area
+                roi_tracker.misses += 1
+                crop = search
+                face_landmarks = detection.find_face(img, crop)
+                bounds = get_face_bounds(face_landmarks) if face_landmarks else None
+            roi_tracker.acquire(bounds, crop)
+
+    if face_landmarks and (crop[0] or crop[2] or scale != 1):
+        face_landmarks = [[int((x + crop[2]) * scale), int((y + crop[0]) * scale)] for x, y in face_landmarks]
+
+    if face_landmarks:
+        face = face_landmarks
         pointLeft = face[145]
         pointRight = face[374]
 
@@ -379,15 +1595,18 @@ def handle_faces(img, faceDetector, targetDetector, cap, transitionFrames, cur_t
 
         safetyXdisplacement = 20
 
-        offsetX, _ = faceDetector.findDistance(face[10], face[252])
-        offsetX = int(offsetX * 2.5)
+        offsetX = int(hypot(face[10][0] - face[252][0], face[10][1] - face[252][1]) * 2.5)
 
         left = lowerLeftBoundX - offsetX
         up = (upperBoundY + lowerBoundY) // 2
         right = lowerRightBoundX + safetyXdisplacement + offsetX
         down = lowerBoundY + offsetY
+
+        # Centre third gate, taken from the same landmarks
+        centre_face = width/3 <= (lowerLeftBoundX + lowerRightBoundX) / 2 <= 2*width/3
         
     else:
+        centre_face = False
         up = down = left = right = 0
         eye_center_x = width/2
         eye_center_y = height/2
@@ -395,158 +1614,1487 @@ def handle_faces(img, faceDetector, targetDetector, cap, transitionFrames, cur_t
     eye_center_x_rad = (eye_center_x - width/2)*(pi/3) / (width/2)
     eye_center_y_rad = -(eye_center_y - height/2)*(pi/3) / (width/2)
 
+    if not centre_face:
+        cur_transition = transitionFrames
+
+    return eye_center_x_rad, eye_center_y_rad, (eye_center_x, eye_center_y), face, [up,down,left,right], cur_transition, centre_face, img
+
+
+# Smallest head pose change worth writing, in rad for the HDRI and m for the bulb.
+# One pixel of landmark motion at the default 640 px detection width is 3.3e-3 rad,
+# so a still viewer's landmark noise stays below it and EEVEE gets to refine
+WRITE_THRESHOLD = 6e-3
+
+# SCENE BINDINGS
+# The world mapping node, camera and bulb empty a session writes on every tick,
+# looked up once instead of by name each time. Adding or removing objects, a new
+# HDRI or loading a file drops them and they are looked up again on the next flush
+class SceneBindings:
+    def __init__(self, camera_name, threshold=WRITE_THRESHOLD):
+        self.camera_name = camera_name
+        self.threshold = threshold
+        self.pending = {}       # channel -> values of this tick
+        self.invalidate()
+
+    def invalidate(self, *args):
+        self.world = None
+        self.mapping = None
+        self.camera = None
+        self.bulb_empty = None
+        self.written = {}       # last values written, per channel
+        self.resolved = False
+
+    def resolve(self):
+        self.world = bpy.data.worlds.get("World")
+        node_tree = self.world.node_tree if self.world is not None else None
+        self.mapping = node_tree.nodes.get("Mapping") if node_tree is not None else None
+        self.camera = bpy.data.objects.get(self.camera_name)
+        self.bulb_empty = bpy.data.objects.get('bulb_empty')
+        self.object_count = len(bpy.data.objects)
+        self.node_count = len(node_tree.nodes) if node_tree is not None else 0
+        self.resolved = True
+
+    # Only counts are compared, this runs after every depsgraph update (ours included)
+    def on_depsgraph_update(self, *args):
+        if not self.resolved:
+            return
+        try:
+            node_count = len(self.world.node_tree.nodes) if self.world is not None and self.world.node_tree is not None else 0
+        except ReferenceError:
+            node_count = -1
+        if len(bpy.data.objects) != self.object_count or node_count != self.node_count:
+            self.invalidate()
+
+    def set_hdri_pos(self, eye_center_x, eye_center_y):
+        self.pending["hdri"] = (eye_center_y, -eye_center_x)
+
+    def set_bulb_pos(self, eye_center_x, eye_center_y, gallery_position):
+        self.pending["bulb"] = (gallery_position + eye_center_x, eye_center_y)
+
+    def set_camera_pos(self, gallery_position):
+        self.pending["camera"] = (gallery_position,)
+
+    # Writes this tick's values in one go, skipping channels that moved less than
+    # the threshold since their last write. Returns True if the scene changed
+    def flush(self):
+        if not self.pending:
+            return False
+        if not self.resolved:
+            self.resolve()
+
+        changed = False
+        try:
+            for channel, values in self.pending.items():
+                last = self.written.get(channel)
+                # The camera is written exactly, a transition has to land on its painting
+                if last is not None and channel != "camera" and max(abs(value - previous) for value, previous in zip(values, last)) < self.threshold:
+                    continue
+                if self.write(channel, values):
+                    self.written[channel] = values
+                    changed = True
+        except ReferenceError:
+            # Removed from under us, look everything up again next time
+            self.invalidate()
+        self.pending = {}
+        return changed
+
+    def write(self, channel, values):
+        if channel == "hdri" and self.mapping is not None:
+            self.mapping.inputs[2].default_value[1:3] = values
+        elif channel == "bulb" and self.bulb_empty is not None:
+            self.bulb_empty.location[1:3] = values
+        elif channel == "camera" and self.camera is not None:
+            self.camera.location[1] = values[0]
+        else:
+            return False
+        return True
+
+# RENDER GOVERNOR
+# EEVEE restarts its sample accumulation whenever the scene changes, so while the
+# viewer or camera moves only a few samples are asked for. Once the scene has been
+# still for settle_time the full count is restored and the viewport refines from there
+class RenderGovernor:
+    def __init__(self, scene, full_samples, motion_samples=4, settle_time=0.25):
+        self.scene = scene
+        self.full_samples = full_samples
+        self.motion_samples = min(motion_samples, full_samples)
+        self.settle_time = settle_time
+        self.last_change = 0.0
+        self.samples = full_samples
+        self.set_samples(full_samples)
+
+    def set_samples(self, samples):
+        self.scene.eevee.taa_samples = samples
+        self.samples = samples
+
+    def update(self, scene_changed, now):
+        if scene_changed:
+            self.last_change = now
+            if self.samples != self.motion_samples:
+                self.set_samples(self.motion_samples)
+        elif self.samples != self.full_samples and now - self.last_change >= self.settle_time:
+            self.set_samples(self.full_samples)
+
+    def restore(self):
+        if self.samples != self.full_samples:
+            self.set_samples(self.full_samples)
+
+# DYNAMIC RESOLUTION
+# Scales the render resolution to hold the frame budget. The viewport only draws
+# at 1, 2 or 4 pixel blocks (preview_pixel_size), so the controller moves between
+# those levels, final renders follow with the percentage. It drops a level once
+# frame times stay over 110% of the budget for a while, and only climbs back when
+# the frame time scaled to the next level's pixel count would still fit the budget
+RESOLUTION_LEVELS = ((1.0, '1'), (0.5, '2'), (0.25, '4'))   # (scale, preview_pixel_size)
+
+class ResolutionController:
+    # lowest is the preview_pixel_size of the lowest level allowed
+    def __init__(self, scene, frame_budget, lowest='2', down_frames=10, up_frames=60, settle_frames=30):
+        self.scene = scene
+        self.frame_budget = frame_budget
+        self.down_frames = down_frames
+        self.up_frames = up_frames
+        self.settle_frames = settle_frames
+        self.lowest = next(level for level, (_, pixel_size) in enumerate(RESOLUTION_LEVELS) if pixel_size == lowest)
+
+        self.original = (scene.render.resolution_percentage, scene.render.preview_pixel_size)
+        self.frame_times = []   # filled by the draw callback, drained on the timer
+        self.frame_time = frame_budget  # smoothed
+        self.over = 0
+        self.under = 0
+        self.settle = 0
+        self.level = 0
+        self.apply()
+
+    # Called from the draw callback, must not write to the scene
+    def add_frame(self, frame_time):
+        self.frame_times.append(frame_time)
+
+    # Returns True when the level changed
+    def update(self):
+        frame_times, self.frame_times = self.frame_times, []
+        for frame_time in frame_times:
+            self.frame_time += (frame_time - self.frame_time) * 0.1
+            if self.settle:
+                self.settle -= 1
+                continue
+            self.over = self.over + 1 if self.frame_time > self.frame_budget * 1.1 else 0
+            if self.level > 0:
+                # Cost taken as proportional to the pixels drawn, which overestimates it,
+                # so the level climbed to is never one that drops straight back
+                predicted = self.frame_time * (RESOLUTION_LEVELS[self.level - 1][0] / self.scale) ** 2
+                self.under = self.under + 1 if predicted < self.frame_budget else 0
+
+        if self.over >= self.down_frames and self.level < self.lowest:
+            self.level += 1
+        elif self.under >= self.up_frames and self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        self.over = self.under = 0
+        self.settle = self.settle_frames
+        self.apply()
+        return True
+
+    def apply(self):
+        self.scale, pixel_size = RESOLUTION_LEVELS[self.level]
+        self.scene.render.resolution_percentage = round(self.scale * 100)
+        self.scene.render.preview_pixel_size = pixel_size
 
-    return eye_center_x_rad, eye_center_y_rad, (eye_center_x, eye_center_y), face, [up,down,left,right], cur_transition, img
+    def restore(self):
+        self.scene.render.resolution_percentage, self.scene.render.preview_pixel_size = self.original
 
+    def summary_line(self):
+        return f"resolution: {self.scale * 100:.0f}%, frame {self.frame_time * 1000:.1f} ms"
 
-def set_hdri_pos(eye_center_x, eye_center_y):
-    try:
-        bpy.data.worlds["World"].node_tree.nodes["Mapping"].inputs[2].default_value[2] = -eye_center_x
-        bpy.data.worlds["World"].node_tree.nodes["Mapping"].inputs[2].default_value[1] = eye_center_y
-    except:
-        pass
 
-def set_bulb_pos(eye_center_x, eye_center_y, current_image, painting_separation):
-    try:
-        bulb_empty = bpy.data.objects['bulb_empty']
-        bulb_empty.location[1] = current_image * painting_separation + eye_center_x
-        bulb_empty.location[2] = eye_center_y
-    except:
-        pass
+'''
+LIGHT FIELD
+Offline bake of every painting over a grid of head angles into memory-mapped view
+grids, so weak machines can play the effect back by blending the nearest views
+instead of running EEVEE live. The bake runs the saved .blend in background Blender
+processes, each rendering its share of the paintings
+    python "realistic virtual oleo painting.py" bake scene.blend --blender blender
+'''
+
+# Next to the .blend
+LIGHT_FIELD_FOLDER = "//.lightfield"
+
+# Largest |x| and |y| head angle handle_faces() gives for a 16:9 capture
+LIGHT_FIELD_RANGE = (pi/3, pi/3 * 9/16)
+
+# folder/manifest.json and one painting_<n>.npy per painting, shaped
+# (rows, columns, height, width, 3) BGR. Rows follow y, columns x, both ascending
+class LightFieldCache:
+    def __init__(self, folder):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, "manifest.json")
+        self.manifest = None
+        self.views = {}
+
+    def create(self, grid, size, light_field_range=LIGHT_FIELD_RANGE, source=""):
+        os.makedirs(self.folder, exist_ok=True)
+        for name in os.listdir(self.folder):
+            if name.startswith("painting_") and name.endswith(".npy"):
+                os.remove(os.path.join(self.folder, name))
+        self.manifest = {"grid": list(grid), "size": list(size), "range": list(light_field_range),
+                         "source": source, "paintings": 0, "complete": False}
+        self.save()
+
+    # Returns True when a finished bake of at least one painting is there
+    def load(self):
+        try:
+            with open(self.manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            self.manifest = None
+            return False
+        return self.manifest.get("complete", False) and self.manifest.get("paintings", 0) >= 1
+
+    def save(self):
+        with open(self.manifest_path, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file)
+
+    def get_view_path(self, painting):
+        return os.path.join(self.folder, f"painting_{painting}.npy")
+
+    # Written by the bake workers, one file per painting
+    def create_views(self, painting):
+        columns, rows = self.manifest["grid"]
+        width, height = self.manifest["size"]
+        return np.lib.format.open_memmap(self.get_view_path(painting), mode="w+", dtype=np.uint8,
+                                         shape=(rows, columns, height, width, 3))
+
+    # Mapped read only, pages are read from disk as views are blended
+    def get_views(self, painting):
+        views = self.views.get(painting)
+        if views is None:
+            views = self.views[painting] = np.load(self.get_view_path(painting), mmap_mode="r")
+        return views
+
+    def finish(self):
+        self.manifest["paintings"] = len(glob.glob(os.path.join(self.folder, "painting_*.npy")))
+        self.manifest["complete"] = True
+        self.save()
+
+def get_light_field_angles(grid, light_field_range=LIGHT_FIELD_RANGE):
+    columns, rows = grid
+    return (np.linspace(-light_field_range[0], light_field_range[0], columns),
+            np.linspace(-light_field_range[1], light_field_range[1], rows))
+
+# Runs inside a background Blender on the saved scene: renders every view of the
+# paintings painting % shards == shard, driving the scene like a session does
+def bake_light_field_views(cache_folder, shard, shards):
+    import tempfile
+
+    cache = LightFieldCache(cache_folder)
+    cache.load()
+    props = bpy.context.scene.custom_props
+    # Numbered like import_paintings() does
+    paths = [os.path.join(props.paintings_folder, name) for name in sorted(os.listdir(props.paintings_folder)) if name[-3:] == "glb"]
+    angles_x, angles_y = get_light_field_angles(cache.manifest["grid"], cache.manifest["range"])
+
+    scene = bpy.context.scene
+    camera = create_camera((props.cam_z_location, 0, 0), (pi/2, 0, pi/2), props.camera_zoom)
+    scene.render.resolution_x, scene.render.resolution_y = cache.manifest["size"]
+    scene.render.resolution_percentage = 100
+    scene.render.image_settings.file_format = 'PNG'
+    scene.render.image_settings.color_mode = 'RGB'
+    scene.render.film_transparent = False
+
+    # Threshold 0, every view has to be written
+    bindings = SceneBindings(camera.name, threshold=0)
+    render_path = os.path.join(tempfile.mkdtemp(), f"view_{shard}.png")
+    scene.render.filepath = render_path
+
+    # A streaming gallery saves only the paintings around the current one. The
+    # others are imported for their own views and removed again
+    resident = {}
+    for obj in bpy.data.objects:
+        if "painting" in obj:
+            resident.setdefault(obj["painting"], []).append(obj.name)
+    import_cache = open_import_cache(props.paintings_folder) if props.import_cache else None
+    lods = TextureTiers(os.path.join(props.paintings_folder, ".lod")) if props.texture_tiers else None
+
+    for painting in range(shard, len(paths), shards):
+        object_names = resident.get(painting)
+        imported = object_names is None
+        if imported:
+            object_names = import_painting(paths[painting], painting, props.paint_separation, import_cache)
+        if lods is not None:
+            lods.set_tier(paths[painting], object_names, 0)
+
+        views = cache.create_views(painting)
+        gallery_position = painting * props.paint_separation
+        for row, eye_center_y in enumerate(angles_y):
+            for column, eye_center_x in enumerate(angles_x):
+                bindings.set_camera_pos(gallery_position)
+                bindings.set_hdri_pos(eye_center_x, eye_center_y)
+                bindings.set_bulb_pos(eye_center_x, eye_center_y, gallery_position)
+                bindings.flush()
+                bpy.ops.render.render(write_still=True)
+                views[row, column] = cv2.imread(render_path, cv2.IMREAD_COLOR)
+        views.flush()
+        del views
+        if imported:
+            remove_painting(object_names)
+        print(f">> Light field of painting {painting} baked")
+
+# Starts the bake pool on a saved .blend, the cache is complete once
+# finish_light_field_bake() saw every process succeed
+def start_light_field_bake(blender, blend_path, cache_folder, grid, size, processes=2):
+    import subprocess
+
+    cache = LightFieldCache(cache_folder)
+    cache.create(grid, size, source=os.path.basename(blend_path))
+    script = os.path.abspath(__file__)
+    return [subprocess.Popen([blender, "-b", blend_path, "--python-exit-code", "1", "--python", script, "--",
+                              "light-field-worker", cache_folder, str(shard), str(processes)])
+            for shard in range(processes)]
+
+# Returns True when the bake succeeded
+def finish_light_field_bake(cache_folder, bake_processes):
+    if any(process.wait() != 0 for process in bake_processes):
+        return False
+    cache = LightFieldCache(cache_folder)
+    cache.load()
+    cache.finish()
+    return True
+
+# Blends the four views around a head pose, and across the two paintings the camera
+# is between while it moves. Every buffer is allocated once
+class LightFieldPlayer:
+    def __init__(self, cache, painting_separation):
+        self.cache = cache
+        self.painting_separation = painting_separation
+        self.columns, self.rows = cache.manifest["grid"]
+        self.width, self.height = cache.manifest["size"]
+        self.range_x, self.range_y = cache.manifest["range"]
+        self.paintings = cache.manifest["paintings"]
+
+        shape = (self.height, self.width, 3)
+        self.blends = [np.empty(shape, np.uint8) for _ in range(2)]
+        self.row_blend = np.empty(shape, np.uint8)
+        self.flipped = np.empty(shape, np.uint8)
+        self.rgba = np.empty((self.height, self.width, 4), np.uint8)
+
+    # Lower grid index and weight of the next one, clamped to the baked range
+    @staticmethod
+    def get_cell(angle, extent, count):
+        position = (min(max(angle, -extent), extent) + extent) / (2 * extent) * (count - 1)
+        index = min(int(position), count - 2)
+        return index, position - index
+
+    def blend_painting(self, painting, eye_center_x, eye_center_y, out):
+        views = self.cache.get_views(painting)
+        column, weight_x = self.get_cell(eye_center_x, self.range_x, self.columns)
+        row, weight_y = self.get_cell(eye_center_y, self.range_y, self.rows)
+        cv2.addWeighted(views[row, column], 1 - weight_x, views[row, column + 1], weight_x, 0, out)
+        cv2.addWeighted(views[row + 1, column], 1 - weight_x, views[row + 1, column + 1], weight_x, 0, self.row_blend)
+        cv2.addWeighted(out, 1 - weight_y, self.row_blend, weight_y, 0, out)
+        return out
+
+    # RGBA view for a gallery position and head pose, bottom row first like a GPU texture
+    def render(self, gallery_position, eye_center_x, eye_center_y):
+        position = min(max(gallery_position / self.painting_separation, 0), self.paintings - 1)
+        painting = int(position)
+        weight = position - painting
+
+        view = self.blend_painting(painting, eye_center_x, eye_center_y, self.blends[0])
+        if weight > 1e-3:
+            next_view = self.blend_painting(painting + 1, eye_center_x, eye_center_y, self.blends[1])
+            cv2.addWeighted(view, 1 - weight, next_view, weight, 0, view)
+
+        cv2.flip(view, 0, self.flipped)
+        cv2.cvtColor(self.flipped, cv2.COLOR_BGR2RGBA, self.rgba)
+        return self.rgba
+
+# Draws an RGBA view over the whole region, from a POST_PIXEL draw handler
+def draw_light_field(rgba, region):
+    import gpu
+    from gpu_extras.presets import draw_texture_2d
+
+    height, width = rgba.shape[:2]
+    pixels = gpu.types.Buffer('UBYTE', width * height * 4, rgba.reshape(-1))
+    texture = gpu.types.GPUTexture((width, height), format='RGBA8', data=pixels)
+    draw_texture_2d(texture, (0, 0), region.width, region.height)
 
 
-def I3D(hand_frames_skip, frame_rate, camera, painting_separation, use_cam, show_detection_view, folder_path):
-    # SELECT CAMERA
-    cap = get_video_device(use_cam)
+'''
+POSE FILTERS
+Smooth the (x, y) head pose in rad and extrapolate it to the time the next redraw
+lands, hiding capture, detection and redraw latency. update() takes a measurement
+with its capture time, predict() the pose at any later time (None before the first
+measurement). Prediction stops max_horizon seconds after the last measurement, so a
+lost face holds still instead of drifting away
+'''
 
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 10000)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 10000)
+# Last measurement as is, the behaviour without filtering
+class PassthroughPoseFilter:
+    def __init__(self):
+        self.pose = None
+
+    def update(self, pose, timestamp):
+        self.pose = pose
+
+    def predict(self, timestamp):
+        return self.pose
+
+# One-Euro filter (Casiez et al.): cutoff rises with speed, so slow motion is
+# smoothed hard and fast motion keeps little lag. The filtered speed drives prediction
+class OneEuroPoseFilter:
+    def __init__(self, min_cutoff=1.0, beta=1.0, d_cutoff=1.0, max_horizon=0.25):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.max_horizon = max_horizon
+        self.pose = None
+        self.speed = (0.0, 0.0)
+        self.timestamp = None
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        tau = 1 / (2 * pi * cutoff)
+        return 1 / (1 + tau / dt)
+
+    def update(self, pose, timestamp):
+        if self.pose is None or timestamp <= self.timestamp:
+            self.pose, self.timestamp = tuple(pose), timestamp
+            return
+
+        dt = timestamp - self.timestamp
+        filtered_pose, filtered_speed = [], []
+        for value, previous, previous_speed in zip(pose, self.pose, self.speed):
+            speed = previous_speed + self.alpha(self.d_cutoff, dt) * ((value - previous) / dt - previous_speed)
+            cutoff = self.min_cutoff + self.beta * abs(speed)
+            filtered_pose.append(previous + self.alpha(cutoff, dt) * (value - previous))
+            filtered_speed.append(speed)
+
+        self.pose, self.speed, self.timestamp = tuple(filtered_pose), tuple(filtered_speed), timestamp
+
+    def predict(self, timestamp):
+        if self.pose is None:
+            return None
+        ahead = min(max(0, timestamp - self.timestamp), self.max_horizon)
+        return tuple(value + speed * ahead for value, speed in zip(self.pose, self.speed))
+
+# Constant-velocity Kalman filter, one independent [position, speed] state per axis
+class KalmanPoseFilter:
+    def __init__(self, process_noise=20.0, measurement_noise=1e-3, max_horizon=0.25):
+        self.q = process_noise
+        self.r = measurement_noise
+        self.max_horizon = max_horizon
+        self.states = None      # per axis: [position, speed, p00, p01, p11]
+        self.timestamp = None
+
+    def update(self, pose, timestamp):
+        if self.states is None:
+            self.states = [[value, 0.0, self.r, 0.0, 1.0] for value in pose]
+            self.timestamp = timestamp
+            return
+
+        dt = max(1e-4, timestamp - self.timestamp)
+        for state, value in zip(self.states, pose):
+            position, speed, p00, p01, p11 = state
+
+            # Predict
+            position += speed * dt
+            p00 += dt * (2 * p01 + dt * p11) + self.q * dt**3 / 3
+            p01 += dt * p11 + self.q * dt**2 / 2
+            p11 += self.q * dt
+
+            # Correct with the measured position
+            k0 = p00 / (p00 + self.r)
+            k1 = p01 / (p00 + self.r)
+            innovation = value - position
+            state[:] = [position + k0 * innovation, speed + k1 * innovation,
+                        (1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01]
+        self.timestamp = timestamp
+
+    def predict(self, timestamp):
+        if self.states is None:
+            return None
+        ahead = min(max(0, timestamp - self.timestamp), self.max_horizon)
+        return tuple(state[0] + state[1] * ahead for state in self.states)
+
+def get_pose_filter(pose_filter):
+    if pose_filter == 'ONE_EURO':
+        return OneEuroPoseFilter()
+    if pose_filter == 'KALMAN':
+        return KalmanPoseFilter()
+    return PassthroughPoseFilter()
 
-    # INSTANCIATE Face AND Hand DETECTION MODULES
-    targetDetector = FaceMeshDetector(maxFaces=1, minDetectionCon=0.3)
-    transitionFrames = 5
-    cur_transition = transitionFrames
-    faceDetector = FaceMeshDetector(maxFaces=1, minDetectionCon=0.3)
-    hand_detector = HandDetector(detectionCon=0.4, maxHands=1, minTrackCon=0.5)
-    gesture_detection = 1    # 0: Don't detect (just detected), 1: Can detect (out of box // no finger postiton), 2: detecting
 
-    hand_buffer = {}
+'''
+FRAME TIMINGS
+Monotonic timestamps of every stage of every frame, kept in a preallocated ring
+buffer. The tracking thread and the main thread write different stages of a row
+'''
 
-    print(f">> Camera Started")
+TIMING_STAGES = ("captured", "acquired", "prepared", "face", "hand", "preview", "sent", "applied", "drawn")
+
+class FrameTimings:
+    def __init__(self, frame_budget, capacity=16384):
+        self.frame_budget = frame_budget
+        self.capacity = capacity
+        self.stamps = np.full((capacity, len(TIMING_STAGES)), np.nan)
+        self.frame_ids = np.full(capacity, -1, dtype=np.int64)
+        self.columns = {stage: column for column, stage in enumerate(TIMING_STAGES)}
+        self.frames = 0
+        self.deadline_misses = 0
+
+    def begin(self, frame_id, captured, acquired):
+        row = frame_id % self.capacity
+        self.stamps[row] = np.nan
+        self.stamps[row, 0] = captured
+        self.stamps[row, 1] = acquired
+        self.frame_ids[row] = frame_id
+        self.frames += 1
+
+    def stamp(self, frame_id, stage):
+        row = frame_id % self.capacity
+        if self.frame_ids[row] != frame_id:
+            return
+        self.stamps[row, self.columns[stage]] = now = monotonic()
+
+        # Tracking work on a frame must fit in one frame of the target rate
+        if stage == "sent" and now - self.stamps[row, 1] > self.frame_budget:
+            self.deadline_misses += 1
+
+    # Rows of the last frames, oldest first
+    def recent(self, window=None):
+        valid = np.flatnonzero(self.frame_ids >= 0)
+        valid = valid[np.argsort(self.frame_ids[valid])]
+        if window:
+            valid = valid[-window:]
+        return self.frame_ids[valid], self.stamps[valid]
+
+    # Rolling p50/p95/p99 in ms of every stage and of capture to send/apply/draw
+    def summary(self, window=600):
+        _, stamps = self.recent(window)
+        if len(stamps) == 0:
+            return {}
+
+        durations = {stage: stamps[:, column] - stamps[:, column - 1] for column, stage in enumerate(TIMING_STAGES) if column}
+        durations["to send"] = stamps[:, self.columns["sent"]] - stamps[:, 0]
+        durations["to apply"] = stamps[:, self.columns["applied"]] - stamps[:, 0]
+        durations["to draw"] = stamps[:, self.columns["drawn"]] - stamps[:, 0]
+
+        summary = {}
+        for name, values in durations.items():
+            values = values[~np.isnan(values)]
+            if len(values):
+                summary[name] = tuple(np.percentile(values, (50, 95, 99)) * 1000)
+        return summary
+
+    def summary_lines(self, window=600):
+        lines = [f"{name}: {p50:.1f} / {p95:.1f} / {p99:.1f} ms" for name, (p50, p95, p99) in self.summary(window).items()]
+        lines.append(f"deadline misses: {self.deadline_misses} of {self.frames}")
+        return lines
+
+    # Whole trace as CSV, or JSON if the path ends in .json
+    def dump(self, path):
+        frame_ids, stamps = self.recent()
+        if path.lower().endswith(".json"):
+            trace = {
+                "stages": TIMING_STAGES,
+                "frame_budget": self.frame_budget,
+                "deadline_misses": self.deadline_misses,
+                "frames": [dict(frame=int(frame_id), **{stage: None if np.isnan(t) else t for stage, t in zip(TIMING_STAGES, row)}) for frame_id, row in zip(frame_ids, stamps)],
+            }
+            with open(path, "w") as trace_file:
+                json.dump(trace, trace_file)
+        else:
+            with open(path, "w", newline="") as trace_file:
+                writer = csv.writer(trace_file)
+                writer.writerow(("frame",) + TIMING_STAGES)
+                for frame_id, row in zip(frame_ids, stamps):
+                    writer.writerow([int(frame_id)] + ["" if np.isnan(t) else f"{t:.6f}" for t in row])
+
+
+# MOTION GATE
+# A detection runs when something moves in its area (the hand area, the face), and
+# at least every max_idle frames. Motion is the mean absolute difference, in grey
+# levels, between a tiny grey copy of the area and the one of the previous frame.
+# An anchored gate compares with the frame the detection last ran on instead, set
+# with set_reference, so slow drift adds up until it crosses the threshold
+class MotionGate:
+    def __init__(self, threshold=3.0, max_idle=10, size=(32, 32), name="hand", anchored=False):
+        self.name = name
+        self.anchored = anchored
+        self.threshold = threshold
+        self.max_idle = max_idle
+        self.size = size
+        self.small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.grey = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.previous = np.empty_like(self.grey)
+        self.difference = np.empty_like(self.grey)
+        self.has_previous = False
+        self.idle = 0
+        self.energy = 0.0
+        self.runs = 0
+        self.skips = 0
+
+    def shrink(self, img, rect):
+        up, down, left, right = rect
+        cv2.resize(img[up:down, left:right], self.size, self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, self.grey)
+
+    # Measures motion in rect (up, down, left, right) and decides if the detection runs
+    def is_due(self, img, rect):
+        self.shrink(img, rect)
+        if self.has_previous:
+            cv2.absdiff(self.grey, self.previous, self.difference)
+            self.energy = float(self.difference.mean())
+        else:
+            self.energy = float("inf")
+        if not self.anchored:
+            self.previous, self.grey = self.grey, self.previous
+            self.has_previous = True
+
+        self.idle += 1
+        due = self.energy >= self.threshold or (self.max_idle > 0 and self.idle >= self.max_idle)
+        if due:
+            self.idle = 0
+        return due
+
+    # Anchored gates only, rect of img as the detection saw it
+    def set_reference(self, img, rect):
+        self.shrink(img, rect)
+        self.previous, self.grey = self.grey, self.previous
+        self.has_previous = True
+        self.idle = 0
+
+    # Frames with an area to look at, counted as detected or skipped
+    def count(self, ran):
+        if ran:
+            self.runs += 1
+        else:
+            self.skips += 1
+
+    def skip_ratio(self):
+        return self.skips / max(1, self.runs + self.skips)
+
+    def summary_line(self):
+        return f"{self.name} detection skipped: {self.skip_ratio() * 100:.0f}%, motion {self.energy:.1f}"
+
+
+# FRAME BUFFERS
+# The flipped capture frame and the detection frame. Preallocated they are written
+# in place every frame, otherwise every frame allocates new ones
+class FrameBuffers:
+    def __init__(self, preallocated=True):
+        self.preallocated = preallocated
+        self.flipped = None
+        self.inference = None
+
+    def get(self, name, shape):
+        buffer = getattr(self, name)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            setattr(self, name, buffer)
+        return buffer
+
+    # Returns the flipped frame and the detection frame, written into buffer when
+    # the detection backend has one
+    def prepare(self, frame, inference_size, scale, buffer=None):
+        if self.preallocated and buffer is None:
+            buffer = self.get("inference", (inference_size[1], inference_size[0], frame.shape[2]))
+        if scale == 1:
+            img = inference_img = cv2.flip(frame, 1, buffer)
+        else:
+            img = cv2.flip(frame, 1, self.get("flipped", frame.shape) if self.preallocated else None)
+            inference_img = cv2.resize(img, inference_size, buffer, interpolation=cv2.INTER_AREA)
+        return img, inference_img
+
+# Allocations, copies and time per frame of both buffer modes on a synthetic frame.
+# Both modes do what a session does: the frame goes to the preview at preview_rate
+# out of frame_rate frames, and the window's overlay is drawn on the published copy
+def benchmark_frames(width, height, inference_width, frames=300, overlay=True, frame_rate=30, preview_rate=15):
+    import tracemalloc
+
+    frame = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+    inference_size, scale = get_inference_size(width, height, inference_width)
+    print(f">> {width}x{height} to {inference_size[0]}x{inference_size[1]}, {frames} frames, "
+          f"overlay {'on' if overlay else 'off'} at {preview_rate} of {frame_rate} fps")
+
+    # Face mesh points and hand area where a centred face would put them
+    rng = np.random.default_rng(0)
+    face = [[int(x), int(y)] for x, y in zip(rng.integers(width // 3, width * 2 // 3, 478), rng.integers(height // 4, height * 3 // 4, 478))]
+    snapshot = SimpleNamespace(hand=None, gesture_detection=0, gesture="none", hand_detect_rect=(height // 2, height, 0, width),
+                               face=face, centre_point=None, stats_lines=[])
+
+    def run(buffers, preview, frame_number):
+        img, inference_img = buffers.prepare(frame, inference_size, scale)
+        # Preview frames of this frame number at the preview rate, the window thread's work done inline
+        if overlay and frame_number * preview_rate // frame_rate != (frame_number - 1) * preview_rate // frame_rate:
+            preview.publish(img, snapshot)
+            shown, shown_snapshot = preview.take()
+            draw_detection_overlay(shown, shown_snapshot)
+
+    results = {}
+    for preallocated in (False, True):
+        buffers = FrameBuffers(preallocated)
+        preview = PreviewWindow(queue.Queue(), rate=0)
+        run(buffers, preview, 0)
+
+        published = preview.published
+        start_time = monotonic()
+        for frame_number in range(1, frames + 1):
+            run(buffers, preview, frame_number)
+        elapsed = monotonic() - start_time
+        # publish copies the whole capture frame
+        copied = (preview.published - published) * frame.nbytes
+
+        # Bytes allocated inside one frame, at its peak
+        tracemalloc.start()
+        allocated = 0
+        for frame_number in range(1, frames + 1):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            run(buffers, preview, frame_number)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+
+        name = "preallocated" if preallocated else "allocating"
+        results[name] = {"ms_per_frame": elapsed / frames * 1000, "bytes_per_frame": allocated / frames,
+                         "bytes_copied_per_frame": copied / frames}
+        print(f">> {name:>12}: {elapsed / frames * 1000:.3f} ms/frame, {allocated / frames / 1024:.1f} KiB allocated/frame, "
+              f"{copied / frames / 1024:.1f} KiB copied/frame")
+    return results
+
+
+# Hand, hand area and face boxes of a pipeline snapshot, drawn in capture pixels
+def draw_detection_overlay(img, snapshot):
+    if snapshot is None:
+        return img
+    gesture_detection = snapshot.gesture_detection
+    hand_detect_rect = snapshot.hand_detect_rect
+    face = snapshot.face
+
+    if snapshot.hand is not None:
+        bbox = snapshot.hand["bbox"]
+        corner = [bbox[0], bbox[1], bbox[0] + bbox[2], bbox[1] + bbox[3]]
+        lmList = snapshot.hand["lmList"]
+
+        if (gesture_detection == 2):
+            cv2.rectangle(img, (corner[0] - 20, corner[1] - 20),
+                        (corner[2] + 20, corner[3] + 20),(255, 0, 0), 3)    
+            cv2.circle(img, (lmList[8][0], lmList[8][1]), 3, (0, 255, 0), 6)
+        elif (gesture_detection == 1):
+            cv2.rectangle(img, (corner[0] - 20, corner[1] - 20),
+                        (corner[2] + 20, corner[3] + 20),(220,220,220), 3) 
+            
+            for points in range(4,21,4):
+                cv2.circle(img, (lmList[points][0], lmList[points][1]), 3, (220,220,220), 6)
+        else:
+            cv2.rectangle(img, (corner[0] - 20, corner[1] - 20),
+                        (corner[2] + 20, corner[3] + 20),(0, 0, 255), 2) 
 
-    # GLOBAL CONTROL VARIABLES
-    current_image = 0
-    frames_count = 0
-    total_paintings = len(glob.glob(os.path.join(folder_path, "*.glb")))
+        if snapshot.gesture != "none":
+            cv2.putText(img, snapshot.gesture, (corner[0] - 20, corner[1] - 30), cv2.FONT_HERSHEY_PLAIN, 1.5, (255, 255, 255), 2)
 
-    print(f">> Recognition Started")
+    if face:
+        # Face mesh points, detection itself never draws on its frame
+        for point in face:
+            cv2.circle(img, (point[0], point[1]), 1, (0, 255, 0), -1)
 
-    while True:
+        cv2.rectangle(img,(hand_detect_rect[2], hand_detect_rect[0]), (hand_detect_rect[3], hand_detect_rect[1]), (200, 200, 200), 2)
+
+        cv2.rectangle(img,(face[234][0],face[10][1]), (face[454][0], face[152][1]), (255,0,0), 2)
         
-        start_time = time()
-        # CAPTURE IMAGE FROM CAMERA   
-        _, img = cap.read() 
-        img = cv2.flip(img, 1)   
+        cv2.circle(img, snapshot.centre_point, 4, (255,0,0), 10)
+
+    for line_number, line in enumerate(snapshot.stats_lines):
+        cv2.putText(img, line, (10, 25 + 22 * line_number), cv2.FONT_HERSHEY_PLAIN, 1.2, (255, 255, 255), 2)
+    return img
+
+
+# DETECTION PREVIEW
+# The live detection window runs on its own thread. The tracking thread only copies
+# the frame and a snapshot of the landmarks into a free slot, at most rate times a
+# second, and never waits for the window. The window is created once and shows the
+# newest slot; q or closing it sends "stop" back through control
+class PreviewWindow(threading.Thread):
+    def __init__(self, control, rate=15, title="Live dectection"):
+        super().__init__(daemon=True)
+        self.control = control
+        self.interval = 1 / rate if rate > 0 else 0
+        self.title = title
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+        # Three slots: one being shown, one holding the newest frame, one to write
+        self.slots = [None, None, None]
+        self.snapshots = [None, None, None]
+        self.latest = None
+        self.in_use = None
+        self.last_publish = 0
+        self.published = 0
+        self.shown = 0
+
+    def is_due(self, now):
+        return now - self.last_publish >= self.interval
+
+    def publish(self, img, snapshot):
+        with self.lock:
+            slot = next(index for index in range(3) if index != self.latest and index != self.in_use)
+        buffer = self.slots[slot]
+        if buffer is None or buffer.shape != img.shape:
+            buffer = self.slots[slot] = np.empty_like(img)
+        np.copyto(buffer, img)
+        self.snapshots[slot] = snapshot
+        with self.lock:
+            self.latest = slot
+        self.last_publish = monotonic()
+        self.published += 1
+
+    # Newest slot not shown yet, it stays reserved until the next take
+    def take(self):
+        with self.lock:
+            if self.latest is None:
+                return None, None
+            self.in_use, self.latest = self.latest, None
+            return self.slots[self.in_use], self.snapshots[self.in_use]
+
+    def run(self):
+        cv2.namedWindow(self.title, cv2.WND_PROP_FULLSCREEN)
+        cv2.setWindowProperty(self.title, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
+
+        # waitKey also paces the window at the preview rate
+        wait = max(1, int(self.interval * 1000))
+        while not self.stop_event.is_set():
+            img, snapshot = self.take()
+            if img is not None:
+                cv2.imshow(self.title, draw_detection_overlay(img, snapshot))
+                self.shown += 1
+
+            key = cv2.waitKey(wait)
+            if key == ord('q') or (self.shown and cv2.getWindowProperty(self.title, cv2.WND_PROP_VISIBLE) < 1):
+                self.control.put("stop")
+                break
+
+        cv2.destroyWindow(self.title)
+        cv2.waitKey(1)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join(timeout=2)
+
+
+'''
+FRAME PIPELINE
+Everything the tracking thread does with one captured frame: downscaling, face and
+hand detection and the gesture state machine. It never touches bpy, so the live
+session and the offline tools share it
+'''
+
+class FramePipeline:
+    def __init__(self, settings, total_paintings, timings, record_gestures=False):
+        self.settings = settings
+        self.total_paintings = max(1, total_paintings)
+        self.timings = timings
+
+        self.capture_shape = None
+        self.inference_size = None
+        self.scale = 1
+        self.buffers = FrameBuffers(settings.preallocate_frames)
+
+        # INSTANCIATE Face AND Hand DETECTION MODULES
+        self.detection = get_detection_backend(settings.detection_backend)
+        self.roi_tracker = FaceRoiTracker() if settings.face_roi_tracking else None
+        self.transitionFrames = 5
+        self.cur_transition = self.transitionFrames
+        self.centre_face = False
+        self.face = False
+        self.centre_point = None
+        self.hand_detect_rect = [0, 0, 0, 0]
+        self.gesture_detection = 1    # 0: Don't detect (just detected), 1: Can detect (out of box // no finger postiton), 2: detecting
+        self.hand_buffer = {}
+        self.gestures = GestureEngine(record=record_gestures)
+        self.motion_gate = None
+        if settings.hand_scheduling == 'MOTION':
+            self.motion_gate = MotionGate(settings.motion_threshold, settings.hand_frames_skip)
+        self.face_gate = None
+        if settings.face_motion_gate:
+            self.face_gate = MotionGate(settings.face_motion_threshold, settings.face_refresh_frames, name="face", anchored=True)
+        self.face_pose = None   # last (x, y) in rad, sent again while the face is still
+
+        # GLOBAL CONTROL VARIABLES
+        self.current_image = 0       # gesture target, may be ahead of the camera
+        self.frames_count = 0
+
+    # Runs detection on a captured frame. Messages for the main thread go to send as
+    # soon as they are known: ("pose", x, y, capture time, frame) and ("goto", painting, step).
+    # Returns the frame id and the flipped frame in capture pixels
+    def process(self, frame, frame_time, send):
+        settings = self.settings
+        hand_frames_skip = settings.hand_frames_skip
+        face_frames_skip = settings.face_frames_skip
+        frame_id = self.frames_count
+        self.timings.begin(frame_id, frame_time, monotonic())
+
+        # DOWNSCALE FOR DETECTION, the driver may not honour the requested mode
+        if frame.shape[:2] != self.capture_shape:
+            self.capture_shape = frame.shape[:2]
+            self.inference_size, self.scale = get_inference_size(frame.shape[1], frame.shape[0], settings.inference_width)
+        inference_size, scale = self.inference_size, self.scale
+
+        # The detection frame is written straight into the backend's buffer, if it has one
+        buffer = self.detection.begin_frame((inference_size[1], inference_size[0], 3))
+        img, inference_img = self.buffers.prepare(frame, inference_size, scale, buffer)
         # img = cv2.flip(img, 0)
         # img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            
-        # GET FACE POSITION, in rad
-        if (gesture_detection!=2):
-            face_pos_x, face_pos_y, centre_point, face, hand_detect_rect, cur_transition, img = handle_faces(img, faceDetector, targetDetector, cap, transitionFrames, cur_transition)
-
-        crop_img = img[hand_detect_rect[0]:hand_detect_rect[1], hand_detect_rect[2]:hand_detect_rect[3]]
+        self.timings.stamp(frame_id, "prepared")
 
+        # Hands of this frame can be searched from the last face box while the face is found
+        hand_rect = get_hand_crop(self.hand_detect_rect, scale, inference_img.shape)
+        hand_area = self.face and not is_crop_empty(hand_rect)
+        if self.motion_gate is None:
+            hand_due = hand_frames_skip <= 1 or self.gesture_detection==2 or frame_id % hand_frames_skip == 0
+        else:
+            # Motion is measured every frame so the previous area stays current
+            hand_due = hand_area and self.motion_gate.is_due(inference_img, hand_rect)
+            hand_due = hand_due or self.gesture_detection==2
+            if hand_area:
+                self.motion_gate.count(hand_due)
+        if hand_area and hand_due:
+            self.detection.prefetch_hand(inference_img, hand_rect)
+            
+        # GET FACE POSITION, in rad. Skipped frames are covered by the pose filter
+        # Both skip settings mean "every n frames", like hand_frames_skip always did
+        face_due = face_frames_skip <= 1 or frame_id % face_frames_skip == 0
+        if (self.gesture_detection!=2 and face_due):
+            # A still face keeps its landmarks and pose, checked on its bounds in inference pixels
+            face_still = False
+            if self.face_gate is not None and self.face and self.face_pose is not None:
+                face_rect = clamp_crop([v / scale for v in get_face_bounds(self.face)], inference_img.shape)
+                if not is_crop_empty(face_rect):
+                    face_still = not self.face_gate.is_due(inference_img, face_rect)
+                    self.face_gate.count(not face_still)
+
+            if face_still:
+                face_pos_x, face_pos_y = self.face_pose
+            else:
+                face_pos_x, face_pos_y, self.centre_point, self.face, self.hand_detect_rect, self.cur_transition, self.centre_face, inference_img = handle_faces(inference_img, self.detection, self.transitionFrames, self.cur_transition, self.centre_face, scale, self.roi_tracker)
+                self.face_pose = (face_pos_x, face_pos_y) if self.face else None
+                # Later frames are compared with this one until face mesh runs again
+                if self.face_gate is not None and self.face:
+                    face_rect = clamp_crop([v / scale for v in get_face_bounds(self.face)], inference_img.shape)
+                    if not is_crop_empty(face_rect):
+                        self.face_gate.set_reference(inference_img, face_rect)
+
+            # SEND ANGLE TO HDRI
+            if face_pos_x + face_pos_y != 0:
+                send(("pose", face_pos_x, face_pos_y, frame_time, frame_id))
+        self.timings.stamp(frame_id, "face")
+
+        # Hand area, in inference pixels
+        hand_rect = get_hand_crop(self.hand_detect_rect, scale, inference_img.shape)
 
         # VERIFY HAND GESTURES EVERY n FPS 
-        if (face and str(crop_img) != "[]" and (hand_frames_skip == 0 or gesture_detection==2 or frames_count % hand_frames_skip == 0)):
-            current_image, hand_buffer, gesture_detection = handle_hands(crop_img, faceDetector, hand_detector, current_image, camera, face, frame_rate, painting_separation, gesture_detection, hand_buffer, total_paintings)         
-            
-            
-        if current_image == -1:
-            #pass
-            break
+        if (self.face and not is_crop_empty(hand_rect) and hand_due):
+            step, self.hand_buffer, self.gesture_detection = handle_hands(inference_img, hand_rect, self.detection, self.gesture_detection, self.gestures, frame_time)         
+            if step:
+                self.current_image = (self.current_image + step) % self.total_paintings
+                send(("goto", self.current_image, step))
+        self.timings.stamp(frame_id, "hand")
+
+        self.frames_count += 1
+        return frame_id, img
+
+    # What the preview draws, copied so the tracking thread can go on
+    def snapshot(self, stats_lines=()):
+        return SimpleNamespace(
+            hand=scale_hand(self.hand_buffer, self.scale) if self.hand_buffer != {} else None,
+            gesture_detection=self.gesture_detection,
+            gesture=self.gestures.last,
+            hand_detect_rect=tuple(self.hand_detect_rect),
+            face=self.face,
+            centre_point=self.centre_point,
+            stats_lines=list(stats_lines))
+
+    def print_stats(self):
+        for gate in (self.motion_gate, self.face_gate):
+            if gate is not None:
+                print(f">> {gate.name.capitalize()} detection runs: {gate.runs}, skipped: {gate.skips} ({gate.skip_ratio() * 100:.0f}%)")
+        if self.roi_tracker is not None:
+            roi_stats = self.roi_tracker.stats()
+            print(f">> Face ROI hits: {roi_stats['hits']}, misses: {roi_stats['misses']}, full-frame detections: {roi_stats['full']}")
+
+    def close(self):
+        self.detection.close()
 
-        if show_detection_view:
 
-            if hand_buffer != {}:   
-                bbox = hand_buffer["bbox"]
-                corner = [bbox[0] + hand_detect_rect[2], bbox[1] + hand_detect_rect[0], bbox[0] + hand_detect_rect[2] + bbox[2], bbox[1] + hand_detect_rect[0] + bbox[3]]
-                lmList = hand_buffer["lmList"]
-    
-                if (gesture_detection == 2):
-                    cv2.rectangle(img, (corner[0] - 20, corner[1] - 20),
-                                (corner[2] + 20, corner[3] + 20),(255, 0, 0), 3)    
-                    cv2.circle(img, (lmList[8][0] + hand_detect_rect[2], lmList[8][1]+hand_detect_rect[0]), 3, (0, 255, 0), 6)
-                elif (gesture_detection == 1):
-                    cv2.rectangle(img, (corner[0] - 20, corner[1] - 20),
-                                (corner[2] + 20, corner[3] + 20),(220,220,220), 3) 
-                    
-                    for points in range(4,21,4):
-                        cv2.circle(img, (lmList[points][0] + hand_detect_rect[2], lmList[points][1]+hand_detect_rect[0]), 3, (220,220,220), 6)
-                else:
-                    cv2.rectangle(img, (corner[0] - 20, corner[1] - 20),
-                                (corner[2] + 20, corner[3] + 20),(0, 0, 255), 2) 
-                    # cv2.putText(img, f"left <-", (corner[0] - 30, corner[1] - 50), cv2.FONT_HERSHEY_PLAIN,
-                    #                 1, (255, 255, 255), 2)
-                    
-                
+'''
+TRACKER DAEMON
+FramePipeline as a process of its own, on another core budget or another machine.
+Every frame it sends one fixed-size pose packet over UDP or a Unix datagram socket
+to one or more Blender sessions, which read them without blocking
+    python "realistic virtual oleo painting.py" daemon --target udp://127.0.0.1:5005
+'''
 
-                # for ix, punto in enumerate(lmList):
-                #     cv2.putText(img, f"{ix}", (punto[0] + hand_detect_rect[2], punto[1]+hand_detect_rect[0]), cv2.FONT_HERSHEY_PLAIN,
-                #                     1, (ix*2,0,255), 2)      
-                
-                # cv2.putText(img, f"fingers: {hand_detector.fingersUp(hand_buffer)}", (corner[0] - 30, corner[3] + 50), cv2.FONT_HERSHEY_PLAIN,
-                #                     1, (255, 255, 255), 2)
+# Little-endian, 46 bytes: magic, daemon session (uint32, random per daemon run),
+# frame id (uint32), capture and send time (float64, wall clock s, so receivers on
+# other synced machines can measure latency), head pose x, y (float32, rad), gallery
+# steps taken so far (int32) and the number of the last one (uint32), gesture
+# (uint8, index in GESTURES) and flags (uint8).
+# Navigation is relative so each session wraps it around its own gallery, and every
+# packet repeats it, so a lost packet loses no step
+POSE_PACKET = struct.Struct("<4sIIddffiIBB")
+POSE_PACKET_MAGIC = b"VOP3"
+POSE_FLAG = 1               # the packet carries a head pose
+TRACKER_ADDRESS = "udp://127.0.0.1:5005"
+
+# "udp://host:port" or "unix:///path/to/socket" as (family, address)
+def parse_tracker_address(address):
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://"):]
+    if address.startswith("udp://"):
+        address = address[len("udp://"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+class PoseSender:
+    def __init__(self, targets):
+        self.targets = [parse_tracker_address(target) for target in targets]
+        self.sockets = {family: socket.socket(family, socket.SOCK_DGRAM) for family, _ in self.targets}
+        self.packet = bytearray(POSE_PACKET.size)
+        self.clock_offset = time() - monotonic()    # monotonic capture times to wall clock
+        self.session = int.from_bytes(os.urandom(4), "little")  # tells receivers the daemon restarted
+        self.steps = 0          # sum of the gallery steps sent
+        self.sequence = 0       # steps sent
+        self.sent = 0
+        self.errors = 0
+
+    # One packet for the session messages of a frame
+    def send(self, frame_id, capture_time, messages, gesture):
+        face_pos_x = face_pos_y = 0.0
+        flags = 0
+        for message in messages:
+            if message[0] == "pose":
+                face_pos_x, face_pos_y = message[1], message[2]
+                flags |= POSE_FLAG
+            elif message[0] == "goto":
+                self.steps += message[2]
+                self.sequence += 1
+
+        POSE_PACKET.pack_into(self.packet, 0, POSE_PACKET_MAGIC, self.session, frame_id & 0xFFFFFFFF,
+                              capture_time + self.clock_offset, time(), face_pos_x, face_pos_y,
+                              self.steps, self.sequence & 0xFFFFFFFF, GESTURES.index(gesture), flags)
+        for family, address in self.targets:
+            try:
+                self.sockets[family].sendto(self.packet, address)
+            except OSError:
+                # Nobody bound to the Unix socket yet, or the network is down
+                self.errors += 1
+        self.sent += 1
+
+    def close(self):
+        for sender_socket in self.sockets.values():
+            sender_socket.close()
+
+# Session side. poll() turns waiting packets into the messages the tracking thread
+# would have queued, with capture times moved to this machine's monotonic clock.
+# Steps are counted from the first packet of a daemon session and resolved against
+# this gallery. Packets older than the newest one (reordered or duplicated) are dropped
+class PoseReceiver:
+    def __init__(self, address, total_paintings):
+        family, self.address = parse_tracker_address(address)
+        self.total_paintings = max(1, total_paintings)
+        if family == socket.AF_UNIX and os.path.exists(self.address):
+            # Left over from an earlier session
+            os.remove(self.address)
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.socket.bind(self.address)
+        self.socket.setblocking(False)
+        self.packet = bytearray(POSE_PACKET.size)
+
+        self.session = None     # daemon session of the last packet
+        self.last_frame = None
+        self.steps = 0
+        self.sequence = None    # last step applied, None until the first packet
+        self.current_image = 0
+        self.gesture = "none"
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.invalid = 0
+        self.transport = 0.0    # send to receive, smoothed
+
+    def poll(self, put, timings=None):
+        while True:
+            try:
+                size = self.socket.recv_into(self.packet)
+            except BlockingIOError:
+                return
+            except OSError:
+                # Windows reports an earlier send that bounced, nothing to read
+                continue
+            if size != POSE_PACKET.size:
+                self.invalid += 1
+                continue
+            magic, session, frame_id, capture_time, send_time, face_pos_x, face_pos_y, steps, sequence, gesture, flags = POSE_PACKET.unpack_from(self.packet)
+            if magic != POSE_PACKET_MAGIC:
+                self.invalid += 1
+                continue
+
+            # A new daemon session starts its frames and steps over, they are taken from there
+            restarted = session != self.session
+            if not restarted and frame_id <= self.last_frame:
+                self.late += 1
+                continue
+
+            now = monotonic()
+            wall_now = time()
+            if not restarted:
+                self.lost += frame_id - self.last_frame - 1
+            self.session = session
+            self.last_frame = frame_id
+            self.received += 1
+            self.transport += (wall_now - send_time - self.transport) / min(self.received, 30)
+            self.gesture = GESTURES[gesture] if gesture < len(GESTURES) else "none"
+
+            captured = now - (wall_now - capture_time)
+            if timings is not None:
+                timings.begin(frame_id, captured, now)
+            if flags & POSE_FLAG:
+                put(("pose", face_pos_x, face_pos_y, captured, frame_id))
+            # Repeated in every packet, a new sequence number means new steps
+            if restarted:
+                self.steps, self.sequence = steps, sequence
+            elif sequence != self.sequence:
+                self.current_image = (self.current_image + steps - self.steps) % self.total_paintings
+                self.steps, self.sequence = steps, sequence
+                put(("goto", self.current_image))
+
+    def summary_line(self):
+        return f"daemon packets: {self.received}, lost {self.lost}, late {self.late}, transport {self.transport * 1000:.1f} ms"
+
+    def close(self):
+        self.socket.close()
+        if self.socket.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.remove(self.address)
+
+# Tracks a camera, or a video file at its own frame rate, until Ctrl+C
+def run_tracker_daemon(settings, targets, video_path=""):
+    if video_path:
+        cap = get_video_device(video_path)
+    else:
+        cap = open_camera(settings.use_cam, settings.capture_mode, settings.inference_width)
+    if cap is None:
+        print(">> No camera available")
+        return 1
+    grabber = FrameGrabber(cap, frame_rate=cap.get(cv2.CAP_PROP_FPS) or 30) if video_path else FrameGrabber(cap)
+    grabber.start()
+
+    timings = FrameTimings(1 / settings.frame_rate)
+    # Only the steps are sent, the receivers know their galleries
+    pipeline = FramePipeline(settings, 1, timings)
+    sender = PoseSender(targets)
+    print(f">> Streaming poses to {', '.join(targets)}")
 
-            if face:
-                cv2.rectangle(img,(hand_detect_rect[2], hand_detect_rect[0]), (hand_detect_rect[3], hand_detect_rect[1]), (200, 200, 200), 2)
+    try:
+        while True:
+            start_time = time()
+            frame, frame_time = grabber.get_latest()
+            if frame is None:
+                if grabber.finished:
+                    break
+                sleep(0.001)
+                continue
+
+            messages = []
+            frame_id, _ = pipeline.process(frame, frame_time, messages.append)
+            sender.send(frame_id, frame_time, messages, pipeline.gestures.last)
+            timings.stamp(frame_id, "preview")
+            timings.stamp(frame_id, "sent")
+
+            sleep(max(0, (1/settings.frame_rate) - (time() - start_time)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        grabber.stop()
+        pipeline.close()
+        sender.close()
+
+    capture_stats = grabber.stats()
+    print(f">> Frames captured: {capture_stats['captured']}, consumed: {capture_stats['consumed']}, dropped: {capture_stats['dropped']}")
+    print(f">> Packets sent: {sender.sent}, send errors: {sender.errors}")
+    pipeline.print_stats()
+    for line in timings.summary_lines(window=None):
+        print(">> " + line)
+    return 0
 
-                cv2.rectangle(img,(face[234][0],face[10][1]), (face[454][0], face[152][1]), (255,0,0), 2)
-                
-                cv2.circle(img, centre_point, 4, (255,0,0), 10)
-                # for ix, punto in enumerate(face):
-                #     cv2.putText(img, f"{ix}", (punto[0], punto[1]), cv2.FONT_HERSHEY_PLAIN,
-                #                     1, (ix*2,0,255), 1)
-                
-                
-            
-            cv2.namedWindow("Live dectection", cv2.WND_PROP_FULLSCREEN)
-            cv2.setWindowProperty("Live dectection", cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
 
-            cv2.imshow("Live dectection", img)
+'''
+TRACKING SESSION
+Capture and detection run on a tracking thread that queues its results. Blender's
+main thread applies them on every timer tick of the StartEffect modal operator and
+redraws on its own, so the UI stays responsive for the whole session
+'''
 
-            if cv2.waitKey(1) ==  ord('q'):
-                cv2.destroyAllWindows()
-                break
+# Session currently running, so the Stop button can reach it
+active_session = None
+
+class TrackingSession:
+    # settings is a snapshot from get_session_settings()
+    def __init__(self, camera, space, settings):
+        self.camera = camera
+        self.space = space
+        self.settings = settings
+        self.frame_rate = settings.frame_rate
+        self.painting_separation = settings.paint_separation
+        self.total_paintings = len(glob.glob(os.path.join(settings.paintings_folder, "*.glb")))
+
+        # Painting the camera is on or heading to, only used by the main thread
+        self.current_image = 0
+        self.animator = CameraAnimator(camera.location[1], self.painting_separation)
+        self.bindings = SceneBindings(camera.name, settings.redraw_threshold)
+        self.scene_changed = False  # last tick wrote to the scene
+        self.governor = None
+        if settings.adaptive_samples:
+            self.governor = RenderGovernor(bpy.context.scene, settings.viewport_samples, settings.motion_samples)
+        self.resolution = None
+        if settings.dynamic_resolution:
+            self.resolution = ResolutionController(bpy.context.scene, 1 / self.frame_rate, settings.lowest_resolution)
+        self.last_draw = None
+        self.timer = None  # modal timer, set by StartEffect
+        self.gallery = active_gallery
+        self.pipeline = None    # set by the tracking thread
+        self.pose = (0, 0)
+        self.applied_pose = None
+        self.area = None
+        self.light_field = None     # LightFieldPlayer, set for baked playback
+        self.light_field_view = None
+        self.previous_shading = None  # viewport shading to restore after playback
+
+        # Head pose is filtered and predicted for the time the next redraw lands
+        self.pose_filter = get_pose_filter(settings.pose_filter)
+        self.latency = 0.0      # capture to apply, smoothed
+        self.latency_samples = 0
+
+        self.timings = FrameTimings(1 / self.frame_rate)
+        self.applied_frame = None   # frame the next viewport draw shows
+        self.stats_lines = []
+
+        # ("pose", x, y, capture time, frame) and ("goto", painting) messages for the main thread
+        self.results = queue.Queue()
+        # "stop" requests from the preview window back to the tracking thread
+        self.control = queue.Queue()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.track, daemon=True)
+        self.receiver = None    # PoseReceiver, set when a tracker daemon does the tracking
+
+    # With a tracker daemon there is no tracking thread, apply_results() reads its packets
+    def start(self):
+        if self.receiver is None:
+            self.thread.start()
+
+    def request_stop(self):
+        self.stop_event.set()
+
+    def is_stopping(self):
+        return self.stop_event.is_set()
+
+    # Wait for the tracking thread to release the camera and detectors
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+        if self.receiver is not None:
+            self.receiver.close()
+
+    def track(self):
+        try:
+            self.track_loop()
+        except Exception as error:
+            print(f">> Tracking stopped: {error}")
+        finally:
+            self.stop_event.set()
+
+    # Runs on the tracking thread, must not touch bpy
+    def track_loop(self):
+        settings = self.settings
+        frame_rate = settings.frame_rate
+        show_detection_view = settings.detection_view
+        timings = self.timings
+
+        # SELECT CAMERA, or a video file played at its own frame rate
+        if settings.video_source:
+            cap = get_video_device(settings.video_source)
         else:
-            try:
-                pass
-            except KeyboardInterrupt:
-                break
+            cap = open_camera(settings.use_cam, settings.capture_mode, settings.inference_width)
+        if cap is None:
+            print(">> No camera available")
+            return
 
+        if settings.video_source:
+            grabber = FrameGrabber(cap, frame_rate=cap.get(cv2.CAP_PROP_FPS) or 30)
+        else:
+            capture_width, capture_height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            inference_size, _ = get_inference_size(capture_width, capture_height, settings.inference_width)
+            print(f">> Capture {describe_capture_mode(cap)}, detection {inference_size[0]}x{inference_size[1]}")
+            grabber = FrameGrabber(cap)
 
-        # SET ANGLE TO HDRI
-        print(face_pos_x, face_pos_y)
-        if face_pos_x + face_pos_y != 0:
-            set_hdri_pos(face_pos_x, face_pos_y)
-            set_bulb_pos(face_pos_x, face_pos_y, current_image, painting_separation)
-        
-        # UPDATE SCREEN and SLEEP
-        frames_count += 1
-        refresh_and_get_delay(frame_rate)
+        # Camera I/O runs on its own thread from here on
+        grabber.start()
+
+        pipeline = self.pipeline = FramePipeline(settings, self.total_paintings, timings)
 
-        # if keyboard.read_key() == "q":
-        #     break
+        preview = None
+        if show_detection_view:
+            preview = PreviewWindow(self.control, settings.preview_rate)
+            preview.start()
+        stats_time = 0
 
-        sleep(max(0, (1/frame_rate) - (time() - start_time)))
-        # print("FPS: ", round(1.0 / (time() - start_time)))
+        print(f">> Camera Started")
+        print(f">> Recognition Started")
 
-    cap.release()
-    cv2.destroyAllWindows()
+        while not self.stop_event.is_set():
+            
+            start_time = time()
+            # TAKE NEWEST IMAGE FROM CAPTURE THREAD
+            frame, frame_time = grabber.get_latest()
+            if frame is None:
+                if grabber.finished:
+                    break
+                sleep(0.001)
+                continue
+
+            frame_id, img = pipeline.process(frame, frame_time, self.results.put)
+
+            # Hand the frame to the preview thread at its own rate
+            now = monotonic()
+            if preview is not None and preview.is_due(now):
+                # Latency summary, refreshed twice a second
+                if settings.show_stats:
+                    if now - stats_time >= 0.5:
+                        self.stats_lines = self.summary_lines()
+                        stats_time = now
+                    preview.publish(img, pipeline.snapshot(self.stats_lines))
+                else:
+                    preview.publish(img, pipeline.snapshot())
+            timings.stamp(frame_id, "preview")
+            timings.stamp(frame_id, "sent")
+
+            sleep(max(0, (1/frame_rate) - (time() - start_time)))
+            # print("FPS: ", round(1.0 / (time() - start_time)))
 
+            try:
+                if self.control.get_nowait() == "stop":
+                    break
+            except queue.Empty:
+                pass
+
+        grabber.stop()
+        pipeline.close()
+        if preview is not None:
+            preview.stop()
+            print(f">> Preview frames published: {preview.published}, shown: {preview.shown}")
+
+        capture_stats = grabber.stats()
+        print(f">> Frames captured: {capture_stats['captured']}, consumed: {capture_stats['consumed']}, dropped: {capture_stats['dropped']}")
+        pipeline.print_stats()
+
+    # Runs on Blender's main thread, once per timer tick
+    def apply_results(self):
+        if self.receiver is not None:
+            self.receiver.poll(self.results.put, self.timings)
+        now = monotonic()
+        applied_frames = []
+        while True:
+            try:
+                message = self.results.get_nowait()
+            except queue.Empty:
+                break
 
-def start_effect(frame_rate, hand_frames_skip, zoom, cam_z_location, painting_separation, res_x, res_y, use_cam, show_detection_view, painting_path):
-    location = (cam_z_location, 0, 0)
+            if message[0] == "goto":
+                self.current_image = message[1]
+                self.animator.move_to(self.current_image)
+                if self.gallery is not None:
+                    self.gallery.set_current(self.current_image)
+            else:
+                _, face_pos_x, face_pos_y, capture_time, frame_id = message
+                self.pose_filter.update((face_pos_x, face_pos_y), capture_time)
+                applied_frames.append(frame_id)
+                self.latency += (now - capture_time - self.latency) / min(self.latency_samples + 1, 30)
+                self.latency_samples += 1
+
+        moving = self.animator.tick()
+        if self.gallery is not None:
+            self.gallery.load_next(neighbours=not moving)
+
+        # Pose at the time this tick's redraw reaches the screen
+        pose = self.pose_filter.predict(now + 1 / self.frame_rate)
+        if pose is not None:
+            self.pose = pose
+
+        if self.light_field is not None:
+            # Baked views, the scene stays as it is and only the viewport redraws
+            view = (self.animator.position(), *self.pose)
+            if view != self.light_field_view:
+                self.light_field_view = view
+                self.area.tag_redraw()
+        # SET ANGLE TO HDRI, the bulb also has to follow a moving camera
+        elif self.pose != self.applied_pose or moving:
+            face_pos_x, face_pos_y = self.pose
+            gallery_position = self.animator.position()
+            self.bindings.set_hdri_pos(face_pos_x, face_pos_y)
+            self.bindings.set_bulb_pos(face_pos_x, face_pos_y, gallery_position)
+            if moving:
+                self.bindings.set_camera_pos(gallery_position)
+            self.applied_pose = self.pose
+        self.scene_changed = self.bindings.flush()
+        if self.governor is not None:
+            self.governor.update(self.scene_changed, now)
+        if self.resolution is not None:
+            self.resolution.update()
+
+        for frame_id in applied_frames:
+            self.timings.stamp(frame_id, "applied")
+        if applied_frames:
+            self.applied_frame = applied_frames[-1]
+
+    # Viewport draw callback, the first draw after a frame was applied shows it
+    def on_draw(self):
+        if self.light_field is not None and self.light_field_view is not None:
+            draw_light_field(self.light_field.render(*self.light_field_view), bpy.context.region)
+
+        if self.applied_frame is not None:
+            self.timings.stamp(self.applied_frame, "drawn")
+            self.applied_frame = None
+
+        # Frame time between back to back draws, idle gaps are not frames
+        now = monotonic()
+        if self.resolution is not None and self.last_draw is not None and now - self.last_draw < 0.25:
+            self.resolution.add_frame(now - self.last_draw)
+        self.last_draw = now
+
+    def summary_lines(self):
+        lines = self.timings.summary_lines()
+        if self.resolution is not None:
+            lines.append(self.resolution.summary_line())
+        if self.gallery is not None:
+            lines.append(self.gallery.summary_line())
+        if self.pipeline is not None:
+            for gate in (self.pipeline.motion_gate, self.pipeline.face_gate):
+                if gate is not None:
+                    lines.append(gate.summary_line())
+        if self.receiver is not None:
+            lines.append(self.receiver.summary_line())
+        return lines
+
+
+def start_effect(settings):
+    # Bound first, a taken port fails the start before the viewport is touched
+    receiver = None
+    if settings.tracking_source == 'DAEMON':
+        total_paintings = len(glob.glob(os.path.join(settings.paintings_folder, "*.glb")))
+        receiver = PoseReceiver(settings.tracker_address, total_paintings)
+
+    location = (settings.cam_z_location, 0, 0)
     rotation = (pi/2, 0, pi/2)
 
     # recommended zoom:
@@ -554,13 +3102,44 @@ def start_effect(frame_rate, hand_frames_skip, zoom, cam_z_location, painting_se
     #   62.38 portrait view
     # # # #   #########   # # # #
 
-    camera = create_camera(location, rotation, zoom)
+    camera = create_camera(location, rotation, settings.camera_zoom)
     space, context = get_area_sene_context()
-    space = set_viewport_start(space, context, res_x, res_y, zoom)
-    # WHILE LOOP
-    I3D(hand_frames_skip, frame_rate, camera, painting_separation, use_cam, show_detection_view, painting_path)
+    space = set_viewport_start(space, context, settings.res_x, settings.res_y, settings.camera_zoom, settings.viewport_samples)
+
+    # BAKED LIGHT FIELD, played back instead of rendering the scene
+    light_field = None
+    previous_shading = None
+    if settings.light_field:
+        cache = LightFieldCache(bpy.path.abspath(LIGHT_FIELD_FOLDER))
+        if cache.load():
+            light_field = LightFieldPlayer(cache, settings.paint_separation)
+            previous_shading = space.shading.type
+            space.shading.type = 'SOLID'
+        else:
+            print(">> No baked light field, rendering live")
+
+    # TRACKING THREAD
+    session = TrackingSession(camera, space, settings)
+    session.area = context['area']
+    session.light_field = light_field
+    session.previous_shading = previous_shading
+    session.receiver = receiver
+    session.draw_handler = bpy.types.SpaceView3D.draw_handler_add(session.on_draw, (), 'WINDOW', 'POST_PIXEL')
+    session.start()
 
-    camera.location[1] = 0
+    return session
+
+
+def end_effect(session):
+    session.stop()
+    bpy.types.SpaceView3D.draw_handler_remove(session.draw_handler, 'WINDOW')
+    if session.governor is not None:
+        session.governor.restore()
+    if session.resolution is not None:
+        print(f">> Final {session.resolution.summary_line()}")
+        session.resolution.restore()
+
+    session.camera.location[1] = 0
 
     try:
         bulb_empty = bpy.data.objects['bulb_empty']
@@ -568,11 +3147,45 @@ def start_effect(frame_rate, hand_frames_skip, zoom, cam_z_location, painting_se
     except:
         pass
 
-    set_viewport_end(space)
-
+    set_viewport_end(session.space)
+    if session.previous_shading is not None:
+        session.space.shading.type = session.previous_shading
+
+    if session.latency_samples:
+        print(f">> Capture to apply latency: {session.latency * 1000:.1f} ms")
+    if session.receiver is not None:
+        print(f">> {session.receiver.summary_line()}")
+    for line in session.timings.summary_lines(window=None):
+        print(f">> {line}")
+    if session.settings.trace_path:
+        trace_path = bpy.path.abspath(session.settings.trace_path)
+        session.timings.dump(trace_path)
+        print(f">> Frame timings written to {trace_path}")
     print("Program finished") 
 
 
+# Scene handlers stay registered while the add-on is, Blender only keeps
+# persistent handlers across file loads. They reach whichever session is running
+@bpy.app.handlers.persistent
+def on_depsgraph_update(*args):
+    if active_session is not None:
+        active_session.bindings.on_depsgraph_update()
+
+# Loading a file drops the modal operator without it ending the session, the
+# session is ended here while the old scene still exists
+@bpy.app.handlers.persistent
+def on_load_pre(*args):
+    global active_session
+    if active_session is None:
+        return
+    session, active_session = active_session, None
+    if session.timer is not None:
+        bpy.context.window_manager.event_timer_remove(session.timer)
+    end_effect(session)
+
+SCENE_HANDLERS = (("depsgraph_update_post", on_depsgraph_update), ("load_pre", on_load_pre))
+
+
 def install_req():
     import subprocess
     import sys
@@ -595,6 +3208,12 @@ This part creates the interface of buttons and inputs to modify the parameters b
 '''
 
 # Group of internal variables
+# Environments for the HDRI dropdown. Blender needs the list kept alive
+hdri_items = []
+def get_hdri_items(self, context):
+    hdri_items[:] = [(name, name, path) for name, (path, *_) in hdri_library.environments.items()] or [('NONE', "None", "")]
+    return hdri_items
+
 class VariablesGroup(bpy.types.PropertyGroup):
     HDRI_path:          bpy.props.StringProperty(default='"C:/Users/aleja/Downloads/20240423 I-Zone 360HDR/20240423 I-Zone 360HD/Scene5_Compressed.exr"')
     init_rotation:      bpy.props.FloatProperty(soft_min=0, soft_max=360, default=0.0, unit="ROTATION")
@@ -604,7 +3223,15 @@ class VariablesGroup(bpy.types.PropertyGroup):
     bulb_pos_y:         bpy.props.FloatProperty(default=0.0)
     bulb_pos_z:         bpy.props.FloatProperty(default=0.5)
     frame_rate:         bpy.props.IntProperty(default=60)
-    hand_frames_skip:   bpy.props.IntProperty(soft_min=1, default=10)
+    hand_frames_skip:   bpy.props.IntProperty(soft_min=1, default=10, description="Look for hands every n frames, 0 or 1 for every frame")
+    hand_scheduling:    bpy.props.EnumProperty(items=[('MOTION', "On motion", "Look for hands when the hand area changes, at least every 'Hands Skip Frames'"),
+                                                      ('FIXED', "Fixed", "Look for hands every 'Hands Skip Frames'")],
+                                               default='MOTION')
+    motion_threshold:   bpy.props.FloatProperty(min=0, default=3.0)
+    face_motion_gate:   bpy.props.BoolProperty(default=True)
+    face_motion_threshold: bpy.props.FloatProperty(min=0, default=1.0)
+    face_refresh_frames: bpy.props.IntProperty(min=1, default=15)
+    preallocate_frames: bpy.props.BoolProperty(default=True)
     cam_z_location:     bpy.props.FloatProperty(default=1.801)
     paint_separation:   bpy.props.FloatProperty(default=1.5)
     camera_zoom:        bpy.props.FloatProperty(soft_min=0, default=29.20)
@@ -613,6 +3240,72 @@ class VariablesGroup(bpy.types.PropertyGroup):
     internal_cam:       bpy.props.BoolProperty()
     detection_view:     bpy.props.BoolProperty()
     fov:                bpy.props.FloatProperty(soft_min=45, soft_max=180, default=85*pi/180, unit="ROTATION")
+    inference_width:    bpy.props.IntProperty(soft_min=0, default=640)
+    capture_mode:       bpy.props.EnumProperty(items=[('MAX', "Largest", "Capture at the largest mode the camera offers"),
+                                                      ('MATCH', "Match detection", "Capture at the smallest mode covering the detection width")],
+                                               default='MAX')
+    detection_backend:  bpy.props.EnumProperty(items=[('INPROCESS', "In-process", "Run face and hand detection inside Blender"),
+                                                      ('WORKERS', "Worker processes", "Run face and hand detection in parallel worker processes")],
+                                               default='INPROCESS')
+    face_frames_skip:   bpy.props.IntProperty(min=0, default=0, description="Run face detection every n frames, 0 or 1 for every frame")
+    face_roi_tracking:  bpy.props.BoolProperty(default=True)
+    show_stats:         bpy.props.BoolProperty(default=False)
+    preview_rate:       bpy.props.IntProperty(default=15, min=1, max=60)
+    trace_path:         bpy.props.StringProperty(default="", subtype='FILE_PATH')
+    video_source:       bpy.props.StringProperty(default="", subtype='FILE_PATH')
+    viewport_samples:   bpy.props.IntProperty(min=1, default=45)
+    motion_samples:     bpy.props.IntProperty(min=1, default=4)
+    adaptive_samples:   bpy.props.BoolProperty(default=True)
+    redraw_threshold:   bpy.props.FloatProperty(min=0, default=WRITE_THRESHOLD, precision=5)
+    dynamic_resolution: bpy.props.BoolProperty(default=False)
+    lowest_resolution:  bpy.props.EnumProperty(items=[('1', "100%", "Keep full resolution"),
+                                                      ('2', "50%", "Drop to half resolution at most"),
+                                                      ('4', "25%", "Drop to quarter resolution at most")],
+                                               default='2')
+    streaming_gallery:  bpy.props.BoolProperty(default=False)
+    gallery_window:     bpy.props.IntProperty(min=1, default=2)
+    gallery_budget:     bpy.props.IntProperty(min=64, default=2048)
+    import_cache:       bpy.props.BoolProperty(default=True)
+    texture_tiers:      bpy.props.BoolProperty(default=False)
+    hdri_width:         bpy.props.EnumProperty(items=[('FULL', "Full", "Use the HDRI as it is"),
+                                                      ('4096', "4K", "Half float copy 4096 px wide"),
+                                                      ('2048', "2K", "Half float copy 2048 px wide"),
+                                                      ('1024', "1K", "Half float copy 1024 px wide")],
+                                               default='FULL')
+    hdri_choice:        bpy.props.EnumProperty(items=get_hdri_items)
+    tier_window:        bpy.props.IntProperty(min=0, default=1)
+    tracking_source:    bpy.props.EnumProperty(items=[('CAMERA', "Camera", "Track the camera inside Blender"),
+                                                      ('DAEMON', "Tracker daemon", "Receive head poses and gestures from a tracker daemon")],
+                                               default='CAMERA')
+    tracker_address:    bpy.props.StringProperty(default=TRACKER_ADDRESS)
+    light_field:        bpy.props.BoolProperty(default=False)
+    light_field_columns: bpy.props.IntProperty(min=2, default=9)
+    light_field_rows:   bpy.props.IntProperty(min=2, default=5)
+    light_field_width:  bpy.props.IntProperty(min=16, default=960)
+    light_field_height: bpy.props.IntProperty(min=16, default=540)
+    light_field_processes: bpy.props.IntProperty(min=1, default=2)
+    pose_filter:        bpy.props.EnumProperty(items=[('NONE', "None", "Apply raw head poses"),
+                                                      ('ONE_EURO', "One-Euro", "Adaptive low-pass filter with prediction"),
+                                                      ('KALMAN', "Kalman", "Constant-velocity Kalman filter with prediction")],
+                                               default='ONE_EURO')
+
+# Snapshot of the panel settings for a session, the tracking thread never reads bpy
+def get_session_settings(props):
+    settings = SimpleNamespace(**{name: getattr(props, name) for name in VariablesGroup.__annotations__})
+    settings.use_cam = 0 if props.internal_cam else 1
+    settings.video_source = bpy.path.abspath(props.video_source) if props.video_source else ""
+    return settings
+
+# Panel defaults, for sessions run without Blender (replay)
+def get_default_settings():
+    defaults = {}
+    for name, prop in VariablesGroup.__annotations__.items():
+        # bpy keeps property arguments in .keywords, the stand-in gives the default itself
+        keywords = getattr(prop, "keywords", None)
+        defaults[name] = keywords.get("default") if keywords is not None else prop
+    settings = SimpleNamespace(**defaults)
+    settings.use_cam = 0 if settings.internal_cam else 1
+    return settings
 
 # Create the custom panel
 class I3D_panel ():
@@ -664,6 +3357,21 @@ class SET_Environment_1_PT_(I3D_panel, bpy.types.Panel):
         row0 = box0.row()
         row0.label(text = "Separation")
         row0.prop(context.scene.custom_props, 'paint_separation', text = '')
+        box0.prop(context.scene.custom_props, 'import_cache', text = "Cache imports")
+        box0.prop(context.scene.custom_props, 'streaming_gallery', text = "Stream paintings")
+        if context.scene.custom_props.streaming_gallery:
+            row0b = box0.row()
+            row0b.label(text = "Window")
+            row0b.prop(context.scene.custom_props, 'gallery_window', text = '')
+            row0c = box0.row()
+            row0c.label(text = "Memory (MB)")
+            row0c.prop(context.scene.custom_props, 'gallery_budget', text = '')
+        box0.prop(context.scene.custom_props, 'texture_tiers', text = "Texture tiers")
+        if context.scene.custom_props.texture_tiers:
+            row0d = box0.row()
+            row0d.label(text = "Full Texture Window")
+            row0d.prop(context.scene.custom_props, 'tier_window', text = '')
+            box0.operator('my.build_texture_tiers', text = "Build texture tiers", icon="TEXTURE")
         box0.operator('my.import_paintings', text = "Import paintings", icon="PLAY")
 
         layout.separator()
@@ -682,8 +3390,15 @@ class SET_Environment_1_PT_(I3D_panel, bpy.types.Panel):
         # HDRI Strenght INPUT
         row1b.label(text = "Strength")
         row1b.prop(context.scene.custom_props, 'hdri_strength', text = '')
+        row1c = box1.row()
+        row1c.label(text = "Live Resolution")
+        row1c.prop(context.scene.custom_props, 'hdri_width', text = '')
         # Set HDRI BUTTON
         box1.operator('my.set_hdri', text= "Set HDRI", icon="PLAY")
+        if hdri_library.environments:
+            row1d = box1.row()
+            row1d.prop(context.scene.custom_props, 'hdri_choice', text = '')
+            row1d.operator('my.switch_hdri', text= "Switch", icon="FILE_REFRESH")
         box1.operator('my.remove_hdri', text= "Remove HDRI", icon="TRASH")
 
         layout.separator()
@@ -701,6 +3416,22 @@ class SET_Environment_1_PT_(I3D_panel, bpy.types.Panel):
         box2.operator('my.set_light_bulbs', text= "Add new Bulb", icon="ADD")
         box2.operator('my.remove_light_bulbs', text= f"Remove all Bulbs", icon="REMOVE")
 
+# Build Texture Tiers Button
+class SET_Environment_OP_Tiers(bpy.types.Operator):
+    bl_label = "Build texture tiers"          # Button label
+    bl_idname = "my.build_texture_tiers"  # Unique identifier for the button
+    bl_cursor_pending =  "WAIT"
+
+    def execute(self, context):
+        try:
+            written = build_texture_tiers(context.scene.custom_props.paintings_folder)
+        except OSError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f'Tier images written: {written}')
+        return {'FINISHED'}
+
 # Set HDRI Button
 class SET_Environment_OP_HDRI(bpy.types.Operator):
     bl_label = "Set Environment"          # Button label
@@ -710,7 +3441,14 @@ class SET_Environment_OP_HDRI(bpy.types.Operator):
         HDRI_path = context.scene.custom_props.HDRI_path
         hdri_strength = context.scene.custom_props.hdri_strength
         init_rotation = context.scene.custom_props.init_rotation
-        result = set_hdri(HDRI_path, hdri_strength, init_rotation)
+        hdri_width = context.scene.custom_props.hdri_width
+        result = set_hdri(HDRI_path, hdri_strength, init_rotation, hdri_width)
+        # The mapping node may have been rebuilt
+        if active_session is not None:
+            active_session.bindings.invalidate()
+
+        if not result:
+            context.scene.custom_props.hdri_choice = hdri_library.register(HDRI_path, hdri_strength, init_rotation, hdri_width)
 
         if result:
             self.report({'ERROR'}, str(result))
@@ -719,6 +3457,28 @@ class SET_Environment_OP_HDRI(bpy.types.Operator):
 
         return {'FINISHED'}
 
+# Switch HDRI Button, to one set before
+class SET_Environment_OP_HDRI_SWITCH(bpy.types.Operator):
+    bl_label = "Switch Environment"          # Button label
+    bl_idname = "my.switch_hdri"  # Unique identifier for the button
+
+    def execute(self, context):
+        name = context.scene.custom_props.hdri_choice
+        if name not in hdri_library.environments:
+            self.report({'ERROR'}, "No environment set yet")
+            return {'CANCELLED'}
+
+        result = hdri_library.switch(name)
+        if result:
+            self.report({'ERROR'}, str(result))
+            return {'CANCELLED'}
+
+        if active_session is not None:
+            active_session.bindings.invalidate()
+        set_viewport_render()
+
+        return {'FINISHED'}
+
 class SET_Environment_OP_HDRI_REMOVE(bpy.types.Operator):
     bl_label = "Set Environment"          # Button label
     bl_idname = "my.remove_hdri"  # Unique identifier for the button
@@ -766,7 +3526,10 @@ class SET_Environment_OP_Paintings(bpy.types.Operator):
     bl_cursor_pending =  "WAIT"
 
     def execute(self, context):
-        error, info = import_paintings(context.scene.custom_props.paintings_folder, context.scene.custom_props.paint_separation)
+        props = context.scene.custom_props
+        error, info = import_paintings(props.paintings_folder, props.paint_separation,
+                                       props.streaming_gallery, props.gallery_window, props.gallery_budget,
+                                       props.import_cache, props.texture_tiers, props.tier_window)
 
         if error:
             self.report({'ERROR'}, info)
@@ -796,6 +3559,38 @@ class START_Effect_PT_1(I3D_panel, bpy.types.Panel):
         row0b = box1.row()
         row0b.label(text = "Hands Skip Frames")
         row0b.prop(context.scene.custom_props, 'hand_frames_skip', text = '')
+        row0h = box1.row()
+        row0h.label(text = "Hands Detection")
+        row0h.prop(context.scene.custom_props, 'hand_scheduling', text = '')
+        if context.scene.custom_props.hand_scheduling == 'MOTION':
+            row0i = box1.row()
+            row0i.label(text = "Motion Threshold")
+            row0i.prop(context.scene.custom_props, 'motion_threshold', text = '')
+        row0c = box1.row()
+        row0c.label(text = "Detection Width")
+        row0c.prop(context.scene.custom_props, 'inference_width', text = '')
+        row0d = box1.row()
+        row0d.label(text = "Capture Mode")
+        row0d.prop(context.scene.custom_props, 'capture_mode', text = '')
+        row0e = box1.row()
+        row0e.label(text = "Detection")
+        row0e.prop(context.scene.custom_props, 'detection_backend', text = '')
+        row0f = box1.row()
+        row0f.label(text = "Face Skip Frames")
+        row0f.prop(context.scene.custom_props, 'face_frames_skip', text = '')
+        row0g = box1.row()
+        row0g.label(text = "Pose Filter")
+        row0g.prop(context.scene.custom_props, 'pose_filter', text = '')
+        box1.prop(context.scene.custom_props, 'face_roi_tracking', text = "Track face region")
+        box1.prop(context.scene.custom_props, 'preallocate_frames', text = "Reuse frame buffers")
+        box1.prop(context.scene.custom_props, 'face_motion_gate', text = "Reuse still face")
+        if context.scene.custom_props.face_motion_gate:
+            row0j = box1.row()
+            row0j.label(text = "Face Motion Threshold")
+            row0j.prop(context.scene.custom_props, 'face_motion_threshold', text = '')
+            row0k = box1.row()
+            row0k.label(text = "Face Refresh Frames")
+            row0k.prop(context.scene.custom_props, 'face_refresh_frames', text = '')
 
         layout.label(text = "Virtual Camera options")
         box2 = layout.box()
@@ -817,30 +3612,173 @@ class START_Effect_PT_1(I3D_panel, bpy.types.Panel):
         row2b = box3.row()
         row2b.label(text = 'FOV')
         row2b.prop(context.scene.custom_props, 'fov', text = '')
-
+        row2c = box3.row()
+        row2c.label(text = "Samples")
+        row2c.prop(context.scene.custom_props, 'viewport_samples', text = '')
+        box3.prop(context.scene.custom_props, 'adaptive_samples', text = "Fewer samples while moving")
+        if context.scene.custom_props.adaptive_samples:
+            row2d = box3.row()
+            row2d.label(text = "Moving Samples")
+            row2d.prop(context.scene.custom_props, 'motion_samples', text = '')
+        row2e = box3.row()
+        row2e.label(text = "Redraw Threshold")
+        row2e.prop(context.scene.custom_props, 'redraw_threshold', text = '')
+        box3.prop(context.scene.custom_props, 'dynamic_resolution', text = "Scale resolution to hold FPS")
+        if context.scene.custom_props.dynamic_resolution:
+            row2f = box3.row()
+            row2f.label(text = "Lowest Resolution")
+            row2f.prop(context.scene.custom_props, 'lowest_resolution', text = '')
+
+        row3c = layout.row()
+        row3c.label(text = "Tracking")
+        row3c.prop(context.scene.custom_props, 'tracking_source', text = '')
+        if context.scene.custom_props.tracking_source == 'DAEMON':
+            row3d = layout.row()
+            row3d.label(text = "Daemon Address")
+            row3d.prop(context.scene.custom_props, 'tracker_address', text = '')
         layout.prop(context.scene.custom_props, 'internal_cam', text = "Use built-in camera")
+        layout.operator('my.forget_cameras', text= "Probe cameras again", icon="FILE_REFRESH")
+        row3a = layout.row()
+        row3a.label(text = "Video File")
+        row3a.prop(context.scene.custom_props, 'video_source', text = '')
         layout.prop(context.scene.custom_props, 'detection_view', text = "Show detection view")
+        if context.scene.custom_props.detection_view:
+            row3b = layout.row()
+            row3b.label(text = "Preview FPS")
+            row3b.prop(context.scene.custom_props, 'preview_rate', text = '')
+
+        box5 = layout.box()
+        box5.prop(context.scene.custom_props, 'light_field', text = "Play baked light field")
+        row5a = box5.row()
+        row5a.label(text = "Views")
+        col5a = row5a.column()
+        col5a.prop(context.scene.custom_props, 'light_field_columns', text = 'X')
+        col5a.prop(context.scene.custom_props, 'light_field_rows', text = 'Y')
+        row5b = box5.row()
+        row5b.label(text = "View Size")
+        col5b = row5b.column()
+        col5b.prop(context.scene.custom_props, 'light_field_width', text = 'X')
+        col5b.prop(context.scene.custom_props, 'light_field_height', text = 'Y')
+        row5c = box5.row()
+        row5c.label(text = "Processes")
+        row5c.prop(context.scene.custom_props, 'light_field_processes', text = '')
+        box5.operator('my.bake_light_field', text= "Bake light field", icon="RENDER_STILL")
 
         layout.label(text= "Check 'Rendered' Shading", icon="SHADING_RENDERED")
         layout.operator('my.start_effect',text= "Start", icon="VIEW_CAMERA")
-
+        layout.operator('my.stop_effect',text= "Stop (Esc)", icon="CANCEL")
+
+        box4 = layout.box()
+        box4.prop(context.scene.custom_props, 'show_stats', text = "Show frame timings")
+        row4a = box4.row()
+        row4a.label(text = "Trace File")
+        row4a.prop(context.scene.custom_props, 'trace_path', text = '')
+        if context.scene.custom_props.show_stats and active_session is not None:
+            col4 = box4.column(align=True)
+            for line in active_session.summary_lines():
+                col4.label(text = line)
+
+# Runs the session as a modal operator: tracking results are applied on every timer
+# tick and Blender keeps redrawing on its own. Esc or the Stop button ends it
 class StartEffect(bpy.types.Operator):
     bl_label = "Start Effect"          # Button label
     bl_idname = "my.start_effect"  # Unique identifier for the button
 
     def execute(self, context):
-        frame_rate = context.scene.custom_props.frame_rate
-        hand_frames_skip = context.scene.custom_props.hand_frames_skip
-        zoom = context.scene.custom_props.camera_zoom
-        res_x = context.scene.custom_props.res_x
-        res_y = context.scene.custom_props.res_y
-        use_cam = 0 if context.scene.custom_props.internal_cam else 1
-        show_detection_view = context.scene.custom_props.detection_view
-        painting_separation = context.scene.custom_props.paint_separation
-        cam_z_location = context.scene.custom_props.cam_z_location
-        painting_path = context.scene.custom_props.paintings_folder
+        global active_session
+        if active_session is not None:
+            self.report({'WARNING'}, "Effect already running")
+            return {'CANCELLED'}
+
+        settings = get_session_settings(context.scene.custom_props)
         
-        start_effect(frame_rate, hand_frames_skip, zoom, cam_z_location, painting_separation, res_x, res_y, use_cam, show_detection_view, painting_path)
+        try:
+            self.session = active_session = start_effect(settings)
+        except OSError as error:
+            self.report({'ERROR'}, f"Cannot listen for the tracker daemon: {error}")
+            return {'CANCELLED'}
+
+        window_manager = context.window_manager
+        self.timer = self.session.timer = window_manager.event_timer_add(1 / max(1, settings.frame_rate), window=context.window)
+        window_manager.modal_handler_add(self)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        global active_session
+        # Already ended by on_load_pre
+        if self.session is not active_session:
+            return {'CANCELLED'}
+
+        if event.type == 'ESC':
+            self.session.request_stop()
+
+        if self.session.is_stopping():
+            context.window_manager.event_timer_remove(self.timer)
+            end_effect(self.session)
+            active_session = None
+            return {'FINISHED'}
+
+        if event.type == 'TIMER':
+            self.session.apply_results()
+
+        return {'PASS_THROUGH'}
+
+# Bake Light Field Button, the saved scene is rendered by background Blenders while
+# this one stays usable
+class BakeLightField(bpy.types.Operator):
+    bl_label = "Bake Light Field"          # Button label
+    bl_idname = "my.bake_light_field"  # Unique identifier for the button
+
+    def execute(self, context):
+        if not bpy.data.is_saved:
+            self.report({'ERROR'}, "Save the .blend file first, the bake renders the saved scene")
+            return {'CANCELLED'}
+        bpy.ops.wm.save_mainfile()
+
+        props = context.scene.custom_props
+        self.cache_folder = bpy.path.abspath(LIGHT_FIELD_FOLDER)
+        self.bake_processes = start_light_field_bake(bpy.app.binary_path, bpy.data.filepath, self.cache_folder,
+                                                     (props.light_field_columns, props.light_field_rows),
+                                                     (props.light_field_width, props.light_field_height),
+                                                     props.light_field_processes)
+
+        window_manager = context.window_manager
+        self.timer = window_manager.event_timer_add(0.5, window=context.window)
+        window_manager.modal_handler_add(self)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type != 'TIMER' or any(process.poll() is None for process in self.bake_processes):
+            return {'PASS_THROUGH'}
+
+        context.window_manager.event_timer_remove(self.timer)
+        if finish_light_field_bake(self.cache_folder, self.bake_processes):
+            self.report({'INFO'}, f'Light field baked to {self.cache_folder}')
+        else:
+            self.report({'ERROR'}, "Light field bake failed, see the console")
+        return {'FINISHED'}
+
+# Forget Cameras Button, probe indexes and modes again on the next start
+class ForgetCameras(bpy.types.Operator):
+    bl_label = "Probe Cameras Again"          # Button label
+    bl_idname = "my.forget_cameras"  # Unique identifier for the button
+
+    def execute(self, context):
+        CameraProbeCache().clear()
+        self.report({'INFO'}, "Cameras will be probed on the next start")
+
+        return {'FINISHED'}
+
+# Stop Effect Button
+class StopEffect(bpy.types.Operator):
+    bl_label = "Stop Effect"          # Button label
+    bl_idname = "my.stop_effect"  # Unique identifier for the button
+
+    def execute(self, context):
+        if active_session is not None:
+            active_session.request_stop()
 
         return {'FINISHED'}
 
@@ -851,15 +3789,25 @@ def register():
     bpy.utils.register_class(SET_Environment_1_PT_)
     bpy.utils.register_class(SET_Environment_OP_HDRI)
     bpy.utils.register_class(SET_Environment_OP_HDRI_REMOVE)
+    bpy.utils.register_class(SET_Environment_OP_HDRI_SWITCH)
     bpy.utils.register_class(SET_Environment_OP_Bulb_1_)
     bpy.utils.register_class(SET_Environment_OP_Bulb_2_)
     bpy.utils.register_class(SET_Environment_OP_Paintings)
+    bpy.utils.register_class(SET_Environment_OP_Tiers)
     bpy.utils.register_class(START_Effect_PT_1)
     bpy.utils.register_class(StartEffect)
+    bpy.utils.register_class(StopEffect)
+    bpy.utils.register_class(ForgetCameras)
+    bpy.utils.register_class(BakeLightField)
 
     bpy.utils.register_class(VariablesGroup)
     bpy.types.Scene.custom_props = bpy.props.PointerProperty(type=VariablesGroup)
 
+    for name, handler in SCENE_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if handler not in handlers:
+            handlers.append(handler)
+
 # Functional called when add-on is unregistered
 def unregister():
     # bpy.utils.register_class(ICONS_PT_)    
@@ -868,13 +3816,223 @@ def unregister():
     bpy.utils.unregister_class(SET_Environment_1_PT_)
     bpy.utils.unregister_class(SET_Environment_OP_HDRI)
     bpy.utils.unregister_class(SET_Environment_OP_HDRI_REMOVE)
+    bpy.utils.unregister_class(SET_Environment_OP_HDRI_SWITCH)
     bpy.utils.unregister_class(SET_Environment_OP_Bulb_1_)
     bpy.utils.unregister_class(SET_Environment_OP_Bulb_2_)
     bpy.utils.unregister_class(SET_Environment_OP_Paintings)
+    bpy.utils.unregister_class(SET_Environment_OP_Tiers)
     bpy.utils.unregister_class(START_Effect_PT_1)
     bpy.utils.unregister_class(StartEffect)
+    bpy.utils.unregister_class(StopEffect)
+    bpy.utils.unregister_class(ForgetCameras)
+    bpy.utils.unregister_class(BakeLightField)
 
     bpy.utils.unregister_class(VariablesGroup)
     del bpy.types.Scene.custom_props 
 
+    for name, handler in SCENE_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name)
+        if handler in handlers:
+            handlers.remove(handler)
+
+
+'''
+REPLAY
+Feeds a recorded video through FramePipeline outside Blender, either as fast as
+possible or paced like a live camera, and reports throughput, per-frame latency
+and the painting changes the gestures triggered
+    python "realistic virtual oleo painting.py" replay recording.mp4 --realtime
+'''
+
+def replay(video_path, settings, total_paintings, realtime=False, trace_path="", report_path="", gestures_path=""):
+    cap = get_video_device(video_path)
+    if cap is None:
+        print(f">> Cannot open {video_path}")
+        return 1
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    video_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    timings = FrameTimings(1 / settings.frame_rate, capacity=max(video_frames, 1024))
+    pipeline = FramePipeline(settings, total_paintings, timings, record_gestures=bool(gestures_path))
+    events = []
+    video_frame = 0
+    dropped = 0
+    poses = 0
+
+    def send(message):
+        nonlocal poses
+        if message[0] == "pose":
+            poses += 1
+        elif message[0] == "goto":
+            previous = events[-1]["painting"] if events else 0
+            events.append({"frame": video_frame, "time": round(video_frame / video_fps, 3),
+                           "from": previous, "painting": message[1]})
+            print(f">> {video_frame / video_fps:8.2f}s  frame {video_frame}: painting {previous} -> {message[1]}")
+
+    start_time = monotonic()
+    while True:
+        # A live camera moves on while a frame is processed, so late frames are skipped
+        if realtime:
+            lag = monotonic() - (start_time + video_frame / video_fps)
+            if lag < 0:
+                sleep(-lag)
+            elif lag > 1 / video_fps:
+                if not cap.grab():
+                    break
+                video_frame += 1
+                dropped += 1
+                continue
+
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frame_id, _ = pipeline.process(frame, monotonic(), send)
+        timings.stamp(frame_id, "preview")
+        timings.stamp(frame_id, "sent")
+        video_frame += 1
+
+    elapsed = monotonic() - start_time
+    pipeline.close()
+    cap.release()
+
+    processed = pipeline.frames_count
+    print(f">> Frames processed: {processed}, skipped: {dropped}, poses: {poses}, painting changes: {len(events)}")
+    print(f">> {elapsed:.2f}s, {processed / max(elapsed, 1e-9):.1f} frames/s ({video_fps:.1f} fps video)")
+    pipeline.print_stats()
+    for line in timings.summary_lines(window=processed):
+        print(">> " + line)
+
+    if trace_path:
+        timings.dump(trace_path)
+        print(f">> Frame timings written to {trace_path}")
+    if gestures_path:
+        pipeline.gestures.save_recording(gestures_path)
+        print(f">> Hand landmarks written to {gestures_path}")
+    if report_path:
+        report = {"video": video_path, "realtime": realtime, "frames": processed, "skipped": dropped,
+                  "poses": poses, "seconds": elapsed, "fps": processed / max(elapsed, 1e-9),
+                  "hand_skip_ratio": pipeline.motion_gate.skip_ratio() if pipeline.motion_gate is not None else None,
+                  "face_skip_ratio": pipeline.face_gate.skip_ratio() if pipeline.face_gate is not None else None,
+                  "latency": timings.summary(window=processed), "events": events}
+        with open(report_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f">> Report written to {report_path}")
+    return 0
+
+# Command line entry point, only used outside Blender
+def main(argv=None):
+    import argparse
+
+    settings = get_default_settings()
+    parser = argparse.ArgumentParser(description="Virtual oleo painting tracking tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # Detection options of replay and daemon
+    def add_pipeline_arguments(command_parser):
+        command_parser.add_argument("--frame-rate", type=int, default=settings.frame_rate, help="deadline used for the miss count")
+        command_parser.add_argument("--inference-width", type=int, default=settings.inference_width)
+        command_parser.add_argument("--detection", choices=("INPROCESS", "WORKERS"), default=settings.detection_backend)
+        command_parser.add_argument("--hand-skip", type=int, default=settings.hand_frames_skip, help="look for hands every n frames")
+        command_parser.add_argument("--hand-scheduling", choices=("MOTION", "FIXED"), default=settings.hand_scheduling)
+        command_parser.add_argument("--motion-threshold", type=float, default=settings.motion_threshold)
+        command_parser.add_argument("--face-skip", type=int, default=settings.face_frames_skip, help="run face detection every n frames")
+        command_parser.add_argument("--no-roi", action="store_true", help="run face detection on the full frame")
+        command_parser.add_argument("--no-face-gate", action="store_true", help="run face detection on every frame, still or not")
+
+    def apply_pipeline_arguments(args):
+        settings.frame_rate = args.frame_rate
+        settings.inference_width = args.inference_width
+        settings.detection_backend = args.detection
+        settings.hand_frames_skip = args.hand_skip
+        settings.hand_scheduling = args.hand_scheduling
+        settings.motion_threshold = args.motion_threshold
+        settings.face_frames_skip = args.face_skip
+        settings.face_roi_tracking = not args.no_roi
+        settings.face_motion_gate = not args.no_face_gate
+
+    replay_parser = commands.add_parser("replay", help="run a recorded video through face and hand detection")
+    replay_parser.add_argument("video")
+    replay_parser.add_argument("--realtime", action="store_true", help="pace frames like a live camera instead of as fast as possible")
+    replay_parser.add_argument("--paintings", type=int, default=5, help="number of paintings gestures cycle through")
+    add_pipeline_arguments(replay_parser)
+    replay_parser.add_argument("--trace", default="", help="write per-frame timings (.csv or .json)")
+    replay_parser.add_argument("--report", default="", help="write a JSON report")
+    replay_parser.add_argument("--gestures", default="", help="record the hand landmarks (.npz) for the 'gestures' command")
+
+    gestures_parser = commands.add_parser("gestures", help="classify recorded hand landmarks with other thresholds")
+    gestures_parser.add_argument("recording")
+    for name, value in GESTURE_PARAMS.items():
+        gestures_parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+
+    bench_parser = commands.add_parser("bench-frames", help="compare frame buffer modes on a synthetic frame")
+    bench_parser.add_argument("--width", type=int, default=1920)
+    bench_parser.add_argument("--height", type=int, default=1080)
+    bench_parser.add_argument("--inference-width", type=int, default=settings.inference_width)
+    bench_parser.add_argument("--frames", type=int, default=300)
+    bench_parser.add_argument("--no-overlay", action="store_true", help="leave the preview out")
+    bench_parser.add_argument("--frame-rate", type=int, default=settings.frame_rate)
+    bench_parser.add_argument("--preview-rate", type=int, default=settings.preview_rate)
+
+    tiers_parser = commands.add_parser("tiers", help="build downscaled texture tiers for a paintings folder")
+    tiers_parser.add_argument("folder")
+    tiers_parser.add_argument("--processes", type=int, default=None, help="pool size, default: one per CPU")
+
+    bake_parser = commands.add_parser("bake", help="bake the light field of a saved scene in background Blender processes")
+    bake_parser.add_argument("blend")
+    bake_parser.add_argument("--blender", default="blender", help="Blender executable")
+    bake_parser.add_argument("--grid", type=int, nargs=2, default=(settings.light_field_columns, settings.light_field_rows), metavar=("COLUMNS", "ROWS"))
+    bake_parser.add_argument("--size", type=int, nargs=2, default=(settings.light_field_width, settings.light_field_height), metavar=("WIDTH", "HEIGHT"))
+    bake_parser.add_argument("--processes", type=int, default=settings.light_field_processes, help="background Blenders, each bakes every n-th painting")
+
+    daemon_parser = commands.add_parser("daemon", help="track a camera and stream pose packets to Blender sessions")
+    daemon_parser.add_argument("--target", action="append", default=None, help=f"udp://host:port or unix:///path, repeat for several sessions (default {TRACKER_ADDRESS})")
+    daemon_parser.add_argument("--camera", type=int, default=settings.use_cam, help="camera index")
+    daemon_parser.add_argument("--capture-mode", choices=("MAX", "MATCH"), default=settings.capture_mode)
+    daemon_parser.add_argument("--video", default="", help="track a video file instead of a camera")
+    add_pipeline_arguments(daemon_parser)
+
+    args = parser.parse_args(argv)
+    if args.command == "bench-frames":
+        benchmark_frames(args.width, args.height, args.inference_width, args.frames, not args.no_overlay, args.frame_rate, args.preview_rate)
+        return 0
+    if args.command == "gestures":
+        recording = np.load(args.recording)
+        params = {name: getattr(args, name) for name in GESTURE_PARAMS}
+        gestures = classify_gestures(recording["landmarks"], recording["times"], recording["valid"], params)
+        print(f">> {len(gestures)} frames, {int(recording['valid'].sum())} with a hand")
+        for name, count in count_gestures(gestures).items():
+            print(f">> {name}: {count}")
+        return 0
+    if args.command == "tiers":
+        written = build_texture_tiers(args.folder, args.processes)
+        print(f">> Tier images written: {written}")
+        return 0
+    if args.command == "bake":
+        blend_path = os.path.abspath(args.blend)
+        cache_folder = os.path.join(os.path.dirname(blend_path), LIGHT_FIELD_FOLDER[2:])
+        bake_processes = start_light_field_bake(args.blender, blend_path, cache_folder, args.grid, args.size, args.processes)
+        if not finish_light_field_bake(cache_folder, bake_processes):
+            print(">> Light field bake failed")
+            return 1
+        print(f">> Light field baked to {cache_folder}")
+        return 0
+    if args.command == "daemon":
+        apply_pipeline_arguments(args)
+        settings.use_cam = args.camera
+        settings.capture_mode = args.capture_mode
+        return run_tracker_daemon(settings, args.target or [TRACKER_ADDRESS], args.video)
+    if args.command == "replay":
+        apply_pipeline_arguments(args)
+        return replay(args.video, settings, args.paintings, args.realtime, args.trace, args.report, args.gestures)
+
+
+if __name__ == "__main__" and HEADLESS:
+    sys.exit(main())
+
 register()
+
+# Background Blender of a light field bake
+if __name__ == "__main__" and not HEADLESS and "--" in sys.argv:
+    worker_args = sys.argv[sys.argv.index("--") + 1:]
+    if worker_args[:1] == ["light-field-worker"]:
+        bake_light_field_views(worker_args[1], int(worker_args[2]), int(worker_args[3]))